@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -6,7 +7,11 @@ from user_account.views import (
     InvestmentAccountViewSet,
     UserInvestmentAccountViewSet,
     TransactionViewSet,
-    UserViewSet, AdminUserTransactionsView
+    UserViewSet, AdminUserTransactionsView, AdminUserTransactionsExportView, AdminUserBalanceHistoryView,
+    AdminUserTransactionStatsView, RequestStatsView, PortfolioView, AdminUserReportsView, AdminReportView, AdminReportDownloadView
+)
+from user_account.async_views import (
+    AsyncAdminUserTransactionsView, AsyncTransactionDetailView, AsyncTransactionListView, reads_async
 )
 
 
@@ -24,8 +29,33 @@ transaction_list = TransactionViewSet.as_view({'get': 'list', 'post': 'create'})
 transaction_detail = TransactionViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'})
 
 
+# Under ASGI, reads go to async views and writes to the usual sync views.
+async_read_urlpatterns = [
+    path('admin/user-transactions/<int:user_id>/',
+         reads_async(AsyncAdminUserTransactionsView.as_view(), AdminUserTransactionsView.as_view()),
+         name='admin-user-transactions'),
+    path('investment-accounts/<int:investment_account_pk>/transactions/',
+         reads_async(AsyncTransactionListView.as_view(),
+                     TransactionViewSet.as_view({'get': 'list', 'post': 'create'})),
+         name='transactions-list'),
+    path('investment-accounts/<int:investment_account_pk>/transactions/<int:pk>/',
+         reads_async(AsyncTransactionDetailView.as_view(),
+                     TransactionViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+                                                 'delete': 'destroy'})),
+         name='transactions-detail'),
+]
+
+
 urlpatterns = [
     path('admin/user-transactions/<int:user_id>/', AdminUserTransactionsView.as_view(), name='admin-user-transactions'),
+    path('admin/user-transactions/<int:user_id>/export/', AdminUserTransactionsExportView.as_view(), name='admin-user-transactions-export'),
+    path('admin/user-transactions/<int:user_id>/balances/', AdminUserBalanceHistoryView.as_view(), name='admin-user-balances'),
+    path('admin/user-transactions/<int:user_id>/stats/', AdminUserTransactionStatsView.as_view(), name='admin-user-transaction-stats'),
+    path('admin/user-transactions/<int:user_id>/reports/', AdminUserReportsView.as_view(), name='admin-user-reports'),
+    path('admin/reports/<int:pk>/', AdminReportView.as_view(), name='admin-report'),
+    path('admin/reports/<int:pk>/download/', AdminReportDownloadView.as_view(), name='admin-report-download'),
+    path('admin/request-stats/', RequestStatsView.as_view(), name='admin-request-stats'),
+    path('me/portfolio/', PortfolioView.as_view(), name='me-portfolio'),
     path('admin/', admin.site.urls),
     path('', include(router.urls)), 
     path('', include(investment_account_router.urls)), 
@@ -34,3 +64,6 @@ urlpatterns = [
     path('investment-accounts/<int:investment_account_pk>/transactions/', transaction_list, name='transaction-list'),
     path('investment-accounts/<int:investment_account_pk>/transactions/<int:pk>/', transaction_detail, name='transaction-detail'),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = async_read_urlpatterns + urlpatterns
@@ -1,6 +1,14 @@
 from django.contrib import admin
-from .models import InvestmentAccount, UserInvestmentAccount, Transaction
+from .models import (
+    InvestmentAccount, UserInvestmentAccount, Transaction, DailyAccountBalance, IdempotencyKey,
+    TransactionArchive, ArchivedBalance, ReportJob
+)
 
 admin.site.register(InvestmentAccount)
 admin.site.register(UserInvestmentAccount)
 admin.site.register(Transaction)
+admin.site.register(DailyAccountBalance)
+admin.site.register(IdempotencyKey)
+admin.site.register(TransactionArchive)
+admin.site.register(ArchivedBalance)
+admin.site.register(ReportJob)
@@ -0,0 +1,162 @@
+"""
+Archival of old transactions and reads that span the archive.
+
+archive_transactions() moves transactions from before a cutoff into
+TransactionArchive, one account and batch at a time. It adds their totals to
+the account's ArchivedBalance row. Balances and the daily rollup are not
+touched, because archiving changes where a transaction is stored, not what
+it did.
+
+Readers build a TransactionHistory. It includes the archive only when the
+range they ask for starts before archive_horizon(); recent reads hit the live
+table alone.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ArchivedBalance, InvestmentAccount, Transaction, TransactionArchive, archive_horizon
+
+ARCHIVED_FIELDS = ('id', 'investment_account_id', 'transaction_type', 'amount', 'timestamp')
+
+
+class TransactionHistory:
+    """
+    Transactions matching one filter in the live table and, optionally, the
+    archive.
+
+    Covers the QuerySet calls the transaction readers make: filter(),
+    annotate(), order_by(), values() and values_list() apply to both tables. Slicing or
+    iterating runs a single UNION ALL query ordered across both.
+    """
+
+    def __init__(self, live, archived=None, ordering=()):
+        self.live = live
+        self.archived = archived
+        self.ordering = ordering
+
+    def _apply(self, method, *args, **kwargs):
+        archived = None if self.archived is None else getattr(self.archived, method)(*args, **kwargs)
+        return TransactionHistory(getattr(self.live, method)(*args, **kwargs), archived, self.ordering)
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def annotate(self, *args, **kwargs):
+        return self._apply('annotate', *args, **kwargs)
+
+    def values(self, *fields):
+        return self._apply('values', *fields)
+
+    def values_list(self, *fields, **kwargs):
+        return self._apply('values_list', *fields, **kwargs)
+
+    def order_by(self, *fields):
+        return TransactionHistory(self.live, self.archived, fields)
+
+    def since(self, timestamp):
+        # Nothing at or after the horizon is archived.
+        if self.archived is not None and timestamp >= archive_horizon():
+            return TransactionHistory(self.live, None, self.ordering)
+        return self
+
+    def combined(self):
+        if self.archived is None:
+            return self.live.order_by(*self.ordering)
+        return self.live.order_by().union(self.archived.order_by(), all=True).order_by(*self.ordering)
+
+    def __getitem__(self, k):
+        return self.combined()[k]
+
+    def __iter__(self):
+        return iter(self.combined())
+
+    def iterator(self, chunk_size=None):
+        return self.combined().iterator(chunk_size=chunk_size)
+
+    def find(self, **kwargs):
+        # Looks in the archive only when the live table has no match.
+        row = self.live.filter(**kwargs).first()
+        if row is None and self.archived is not None:
+            row = self.archived.filter(**kwargs).first()
+        return row
+
+    async def afind(self, **kwargs):
+        row = await self.live.filter(**kwargs).afirst()
+        if row is None and self.archived is not None:
+            row = await self.archived.filter(**kwargs).afirst()
+        return row
+
+
+def transaction_history(transactions=Q(), start=None):
+    """
+    Transactions matching a Q on the shared Transaction/TransactionArchive
+    fields. start is the earliest timestamp the caller asks for, if any.
+    """
+    live = Transaction.objects.filter(transactions)
+    if start is not None and start >= archive_horizon():
+        return TransactionHistory(live)
+    return TransactionHistory(live, TransactionArchive.objects.filter(transactions))
+
+
+def _archive_batch(investment_account_id, before, batch_size):
+    with transaction.atomic():
+        # Locked so a concurrent edit can't change a row as it moves.
+        rows = list(
+            Transaction.objects.select_for_update()
+            .filter(investment_account_id=investment_account_id, timestamp__lt=before)
+            .order_by('timestamp', 'id')
+            .values(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        TransactionArchive.objects.bulk_create([TransactionArchive(**row) for row in rows])
+        # A queryset delete skips Transaction.delete(), which would reverse
+        # the balance effects.
+        Transaction.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+
+        carried, _ = ArchivedBalance.objects.select_for_update().get_or_create(
+            investment_account_id=investment_account_id, defaults={'archived_before': before}
+        )
+        carried.archived_before = max(carried.archived_before, before)
+        carried.transaction_count += len(rows)
+        for row in rows:
+            if row['transaction_type'] == 'withdrawal':
+                carried.withdrawals += row['amount']
+            else:
+                carried.deposits += row['amount']
+        # Rows move oldest first, so the last one is the latest archived.
+        carried.last_activity = rows[-1]['timestamp']
+        carried.save()
+        return len(rows)
+
+
+def archive_account(investment_account_id, before, batch_size):
+    archived = 0
+    while True:
+        moved = _archive_batch(investment_account_id, before, batch_size)
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+def archive_transactions(before=None, batch_size=None):
+    """
+    Archive every account's transactions from before `before` (default and
+    latest allowed: archive_horizon()). Returns (accounts, transactions)
+    archived.
+    """
+    batch_size = batch_size or settings.TRANSACTION_ARCHIVE['BATCH_SIZE']
+    horizon = archive_horizon()
+    if before is None:
+        before = horizon
+    if before > horizon:
+        raise ValueError(f'Transactions can only be archived up to the horizon, {horizon.isoformat()}.')
+
+    accounts = transactions = 0
+    for investment_account_id in InvestmentAccount.objects.order_by('pk').values_list('pk', flat=True).iterator():
+        moved = archive_account(investment_account_id, before, batch_size)
+        if moved:
+            accounts += 1
+            transactions += moved
+    return accounts, transactions
@@ -0,0 +1,150 @@
+"""
+Async read views for serving under ASGI.
+
+Each request is a coroutine rather than a worker thread, so slow clients on
+the transaction and admin read endpoints don't hold threads. Queries go
+through Django's async ORM. Authentication and permission checks reuse the
+sync DRF classes through sync_to_async.
+"""
+import asyncio
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .archive import transaction_history
+from .conditional import aaccount_updated_at, not_modified, set_validators, validators
+from .fast_serializers import ValuesSerializer
+from .middleware import serialize_time
+from .models import InvestmentAccount, Transaction
+from .pagination import KeysetPagination
+from .permissions import IsAdmin, IsAllowedToView
+from .serializers import (
+    AdminInvestmentAccountSerializer, AdminTransactionSerializer, TransactionFilter, TransactionSerializer
+)
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines.
+
+    dispatch() follows APIView.dispatch(); the parts that may query the
+    database (authentication, permissions, throttles) run in a thread.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+
+def reads_async(read_view, write_view):
+    """
+    Route GET and HEAD to an async view and every other method to the sync
+    view that normally serves the URL.
+    """
+    write_view = sync_to_async(write_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await read_view(request, *args, **kwargs)
+        return await write_view(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+class AsyncTransactionListView(AsyncAPIView):
+    permission_classes = [IsAllowedToView]
+
+    async def get(self, request, investment_account_pk):
+        etag, last_modified = validators(request, await aaccount_updated_at(investment_account_pk))
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            fast = ValuesSerializer(TransactionSerializer)
+            paginator = KeysetPagination()
+            history = transaction_history(Q(investment_account_id=investment_account_pk))
+            page = await paginator.apaginate_queryset(fast.values(history), request, view=self)
+            with serialize_time(request):
+                data = fast.many(page)
+            response = paginator.get_paginated_response(data)
+        return set_validators(response, etag, last_modified)
+
+
+class AsyncTransactionDetailView(AsyncAPIView):
+    permission_classes = [IsAllowedToView]
+
+    async def get(self, request, investment_account_pk, pk):
+        fast = ValuesSerializer(TransactionSerializer)
+        history = transaction_history(Q(investment_account_id=investment_account_pk))
+        row = await fast.values(history).afind(pk=pk)
+        if row is None:
+            raise NotFound()
+        with serialize_time(request):
+            data = fast.to_representation(row)
+        return Response(data)
+
+
+class AsyncAdminUserTransactionsView(AsyncAPIView):
+    """
+    Async AdminUserTransactionsView.get(). The async ORM on Django 4.2 runs a
+    request's queries on one thread-sensitive worker thread, so the account
+    totals and the transaction page are awaited one after the other.
+    """
+    permission_classes = [IsAdmin]
+
+    async def get(self, request, user_id):
+        user = await User.objects.filter(id=user_id).afirst()
+        if user is None:
+            return Response({'error': 'User not found'}, status=404)
+
+        investment_accounts = InvestmentAccount.objects.filter(userinvestmentaccount__user=user)
+        transaction_filter = TransactionFilter(request.GET, queryset=Transaction.objects.none())
+        transactions = transaction_filter.history(Q(investment_account__in=investment_accounts))
+
+        account_serializer = ValuesSerializer(AdminInvestmentAccountSerializer)
+        accounts = account_serializer.values(investment_accounts.with_total_balance().order_by('id'))
+        transaction_serializer = ValuesSerializer(AdminTransactionSerializer)
+        paginator = KeysetPagination()
+
+        account_rows = await _alist(accounts)
+        transaction_page = await paginator.apaginate_queryset(
+            transaction_serializer.values(transactions), request, view=self
+        )
+
+        with serialize_time(request):
+            data = {
+                'total_balance': sum((row['total_balance'] for row in account_rows), Decimal('0')),
+                'accounts': account_serializer.many(account_rows),
+                'transactions': transaction_serializer.many(transaction_page),
+                'next': paginator.get_next_link(),
+            }
+        return Response(data)
+
+
+async def _alist(queryset):
+    return [row async for row in queryset.aiterator()]
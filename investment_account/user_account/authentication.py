@@ -0,0 +1,110 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded LRU mapping whose entries expire at a given
+    epoch time.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = LRUCache(settings.CACHED_JWT_AUTH['TOKEN_CACHE_SIZE'])
+user_cache = LRUCache(settings.CACHED_JWT_AUTH['USER_CACHE_SIZE'])
+
+
+def evict_user(user_id):
+    user_cache.delete(user_id)
+
+
+def clear_caches():
+    token_cache.clear()
+    user_cache.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that skips repeated work on the hot path.
+
+    Verified token claims are kept until the token's own expiry, keyed by a
+    hash of the raw token. Users are cached for USER_CACHE_TTL seconds, so a
+    user deactivated in another process is honoured within that bound.
+    Grants are not cached here: permission checks read them through
+    grant_cache, whose shared entries are evicted as soon as a grant changes.
+    """
+
+    def get_validated_token(self, raw_token):
+        key = hashlib.sha256(raw_token).hexdigest()
+        validated_token = token_cache.get(key)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            token_cache.set(key, validated_token, validated_token['exp'])
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, time.time() + settings.CACHED_JWT_AUTH['USER_CACHE_TTL'])
+        else:
+            self.check_user(user, validated_token)
+        # Requests get their own copy so nothing they set leaks into the cache.
+        return copy.copy(user)
+
+    def check_user(self, user, validated_token):
+        # The checks JWTAuthentication.get_user() makes after loading the user.
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
@@ -0,0 +1,329 @@
+"""
+Benchmark scenarios driven in-process through the project's URLconf.
+
+Each scenario returns per-request latencies and query counts. summarize()
+turns those into p50/p95/p99, requests per second and queries per request.
+compare() checks a run against a stored baseline.
+
+run_serializers() is a database-free microbenchmark of ValuesSerializer
+against the DRF serializer it mirrors; run_renderers() compares
+JSONRenderer with ORJSONRenderer on a seeded admin response;
+run_database() drives concurrent readers and writers with Django's default
+connection settings and then with the configured ones.
+"""
+import json
+import random
+import statistics
+import threading
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .fast_serializers import ValuesSerializer
+from .middleware import QueryTimer
+from .models import InvestmentAccount, Transaction, UserInvestmentAccount
+from .posting import post_transaction
+from .renderers import ORJSONRenderer
+from .serializers import TransactionSerializer
+from .views import AdminUserTransactionsView
+
+
+def measure(request, iterations, warmup=5):
+    for _ in range(warmup):
+        request()
+
+    latencies, queries = [], []
+    started = perf_counter()
+    for _ in range(iterations):
+        timer = QueryTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            start = perf_counter()
+            response = request()
+            latencies.append((perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'Benchmark request failed with {response.status_code}: {response.content[:200]!r}')
+        queries.append(timer.count)
+    return latencies, queries, perf_counter() - started
+
+
+def summarize(latencies, queries, elapsed):
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+    }
+
+
+def _bearer(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+def _first_grant(**flags):
+    grant = UserInvestmentAccount.objects.filter(**flags).select_related('user').order_by('pk').first()
+    if grant is None:
+        raise RuntimeError('No matching grant found; seed a dataset first.')
+    return grant
+
+
+def _admin():
+    return User.objects.filter(is_staff=True).first() or User.objects.create_superuser(
+        username='benchmark-admin', password='benchmark-admin'
+    )
+
+
+def transaction_list(client, iterations):
+    grant = _first_grant(can_view=True)
+    url = f'/investment-accounts/{grant.investment_account_id}/transactions/'
+    headers = _bearer(grant.user)
+    return measure(lambda: client.get(url, **headers), iterations)
+
+
+def transaction_create(client, iterations):
+    grant = _first_grant(can_create=True)
+    url = f'/investment-accounts/{grant.investment_account_id}/transactions/'
+    headers = _bearer(grant.user)
+    body = {'investment_account': grant.investment_account_id, 'transaction_type': 'deposit', 'amount': '10.00'}
+    return measure(lambda: client.post(url, body, content_type='application/json', **headers), iterations)
+
+
+def admin_user_transactions(client, iterations):
+    user_id = _first_grant(can_view=True).user_id
+    url = f'/admin/user-transactions/{user_id}/'
+    headers = _bearer(_admin())
+    return measure(lambda: client.get(url, **headers), iterations)
+
+
+def portfolio(client, iterations):
+    grant = _first_grant(can_view=True)
+    headers = _bearer(grant.user)
+    return measure(lambda: client.get('/me/portfolio/', **headers), iterations)
+
+
+def token_obtain(client, iterations, password='password123'):
+    user = _first_grant(can_view=True).user
+    body = {'username': user.username, 'password': password}
+    return measure(lambda: client.post('/api/token/', body, content_type='application/json'), iterations)
+
+
+API_SCENARIOS = {
+    'transaction_list': transaction_list,
+    'transaction_create': transaction_create,
+    'admin_user_transactions': admin_user_transactions,
+    'portfolio': portfolio,
+    'token_obtain': token_obtain,
+}
+
+
+def run_api(scenarios, iterations):
+    client = Client()
+    results = {}
+    for name in scenarios:
+        results[name] = summarize(*API_SCENARIOS[name](client, iterations))
+    return results
+
+
+def _transactions(count):
+    now = timezone.now()
+    return [
+        Transaction(
+            id=n + 1, investment_account_id=n % 50 + 1,
+            transaction_type='withdrawal' if n % 3 == 0 else 'deposit',
+            amount=Decimal(n % 500000 + 100) / 100,
+            timestamp=now - timedelta(seconds=n * 37, microseconds=n % 1000),
+        )
+        for n in range(count)
+    ]
+
+
+def _best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append((perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def run_serializers(row_counts, repeat=3):
+    """
+    Time TransactionSerializer(many=True) over model instances against
+    ValuesSerializer over the equivalent .values() dicts, and check that both
+    render to the same bytes.
+    """
+    renderer = JSONRenderer()
+    results = {}
+    for count in row_counts:
+        instances = _transactions(count)
+        fast = ValuesSerializer(TransactionSerializer)
+        # What .values() yields for the same rows: foreign keys come back as ids.
+        rows = [{
+            'id': instance.id,
+            'transaction_type': instance.transaction_type,
+            'amount': instance.amount,
+            'timestamp': instance.timestamp,
+            'investment_account': instance.investment_account_id,
+        } for instance in instances]
+
+        if renderer.render(TransactionSerializer(instances, many=True).data) != renderer.render(fast.many(rows)):
+            raise RuntimeError(f'ValuesSerializer output differs from TransactionSerializer at {count} rows')
+
+        drf_ms = _best_of(repeat, lambda: TransactionSerializer(instances, many=True).data)
+        values_ms = _best_of(repeat, lambda: ValuesSerializer(TransactionSerializer).many(rows))
+        results[f'serialize_{count}'] = {
+            'rows': count,
+            'drf_ms': round(drf_ms, 3),
+            'values_ms': round(values_ms, 3),
+            'speedup': round(drf_ms / values_ms, 2),
+        }
+    return results
+
+
+def run_renderers(iterations, page_size=1000):
+    """
+    Render one admin user-transactions response with JSONRenderer and with
+    ORJSONRenderer, checking that both produce the same bytes.
+    """
+    user_id = _first_grant(can_view=True).user_id
+    request = APIRequestFactory().get(f'/admin/user-transactions/{user_id}/', {'page_size': page_size})
+    force_authenticate(request, user=_admin())
+    data = AdminUserTransactionsView.as_view()(request, user_id=user_id).data
+
+    stdlib, fast = JSONRenderer(), ORJSONRenderer()
+    body = stdlib.render(data)
+    if fast.render(data) != body:
+        raise RuntimeError('ORJSONRenderer output differs from JSONRenderer')
+
+    json_ms = _best_of(iterations, lambda: stdlib.render(data))
+    orjson_ms = _best_of(iterations, lambda: fast.render(data))
+    return {
+        'admin_user_transactions': {
+            'rows': len(data['transactions']),
+            'bytes': len(body),
+            'json_ms': round(json_ms, 3),
+            'orjson_ms': round(orjson_ms, 3),
+            'speedup': round(json_ms / orjson_ms, 2),
+        }
+    }
+
+
+def _concurrent_workload(readers, writers, operations):
+    account_ids = list(InvestmentAccount.objects.order_by('pk').values_list('pk', flat=True)[:100])
+    if not account_ids:
+        raise RuntimeError('No accounts found; seed a dataset first.')
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    start = threading.Barrier(readers + writers + 1)
+
+    def read(rng):
+        list(Transaction.objects.filter(investment_account_id=rng.choice(account_ids))
+             .order_by('timestamp', 'id').values('id', 'amount', 'timestamp')[:100])
+
+    def write(rng):
+        post_transaction(rng.choice(account_ids), 'deposit', Decimal('1.00'))
+
+    def worker(operation, counter, seed):
+        rng = random.Random(seed)
+        start.wait()
+        try:
+            for _ in range(operations):
+                try:
+                    operation(rng)
+                    outcome = counter
+                except OperationalError:
+                    outcome = 'errors'
+                with lock:
+                    counts[outcome] += 1
+                # What the request_finished signal does after every request.
+                close_old_connections()
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(read, 'reads', n)) for n in range(readers)]
+    threads += [threading.Thread(target=worker, args=(write, 'writes', readers + n)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    return {
+        'reads_per_s': round(counts['reads'] / elapsed, 1),
+        'writes_per_s': round(counts['writes'] / elapsed, 1),
+        'errors': counts['errors'],
+        'seconds': round(elapsed, 3),
+    }
+
+
+def run_database(readers=4, writers=2, operations=200):
+    """
+    Run the same mixed workload twice: with Django's defaults (a connection
+    per request, SQLite's rollback journal), then with the connection
+    settings and SQLITE_PRAGMAS from settings.py.
+    """
+    alias_settings = connections.settings[DEFAULT_DB_ALIAS]
+    configured = {key: alias_settings[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+    profiles = {
+        # journal_mode persists in the database file, so it is reset explicitly.
+        'before': ({'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}, {'journal_mode': 'delete'}),
+        'after': (configured, settings.SQLITE_PRAGMAS),
+    }
+    results = {}
+    try:
+        for name, (connection_settings, pragmas) in profiles.items():
+            alias_settings.update(connection_settings)
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                connections.close_all()
+                results[name] = _concurrent_workload(readers, writers, operations)
+    finally:
+        alias_settings.update(configured)
+        connections.close_all()
+    return results
+
+
+def load_baseline(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return human-readable regressions: p95 latency beyond tolerance, lower
+    throughput beyond tolerance, or more queries per request than before.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {previous['p95_ms']} ms")
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']} req/s vs baseline {previous['rps']} req/s")
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(
+                f"{name}: {current['queries_per_request']} queries/request vs baseline {previous['queries_per_request']}"
+            )
+    return regressions
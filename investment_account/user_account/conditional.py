@@ -0,0 +1,69 @@
+"""
+HTTP conditional requests for account reads.
+
+InvestmentAccount.updated_at is stamped on every account save, through
+adjust_balance() on every transaction write to the account, and by
+reconcile_balances when it corrects a balance. Any other code that writes
+balance must stamp it too. That makes it the validator for both the account itself and its transaction list. It is
+read with a primary key lookup before anything is serialized, and a client
+whose copy is current gets a 304.
+"""
+import hashlib
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import InvestmentAccount
+
+
+def _updated_at(investment_account_id):
+    return InvestmentAccount.objects.filter(pk=investment_account_id).values_list('updated_at', flat=True)
+
+
+def account_updated_at(investment_account_id):
+    return _updated_at(investment_account_id).first()
+
+
+async def aaccount_updated_at(investment_account_id):
+    return await _updated_at(investment_account_id).afirst()
+
+
+def validators(request, updated_at):
+    """
+    The ETag and Last-Modified timestamp for this request's representation
+    of data last changed at updated_at.
+
+    The ETag also covers the path and query string (pages differ) and the
+    negotiated media type. Last-Modified has one-second resolution, so it is
+    left off while the data could still change within the current second.
+    """
+    if updated_at is None:
+        return None, None
+    digest = hashlib.sha256()
+    for part in (updated_at.isoformat(), request.get_full_path(), request.accepted_media_type or ''):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    last_modified = int(updated_at.timestamp())
+    if last_modified >= int(timezone.now().timestamp()):
+        last_modified = None
+    return quote_etag(digest.hexdigest()[:32]), last_modified
+
+
+def set_validators(response, etag, last_modified):
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """
+    A 304 (or 412 for a failed If-Match) when the request's preconditions
+    settle it, otherwise None and the view goes on to build the response.
+    """
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return None if response is None else set_validators(response, etag, last_modified)
@@ -0,0 +1,42 @@
+import csv
+import json
+
+from rest_framework import serializers
+
+# Same columns, names and formatting as AdminTransactionSerializer.
+EXPORT_FIELDS = ('id', 'investment_account', 'transaction_type', 'amount', 'timestamp')
+EXPORT_COLUMNS = ('id', 'investment_account_id', 'transaction_type', 'amount', 'timestamp')
+
+_timestamp_field = serializers.DateTimeField()
+
+
+class _Echo:
+    # csv.writer only needs write(); returning the line lets us yield it.
+    def write(self, value):
+        return value
+
+
+def transaction_rows(queryset, chunk_size=2000):
+    # values_list() with iterator() streams plain tuples from a server-side
+    # cursor, so memory stays flat regardless of how many rows are exported.
+    rows = queryset.order_by('timestamp', 'id').values_list(*EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+    for pk, investment_account_id, transaction_type, amount, timestamp in rows:
+        yield pk, investment_account_id, transaction_type, str(amount), _timestamp_field.to_representation(timestamp)
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
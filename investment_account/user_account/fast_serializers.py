@@ -0,0 +1,96 @@
+import decimal
+
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.fields import ISO_8601
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.localize or field.normalize_output or field.decimal_places is None:
+        return field.to_representation
+
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        quantized = value.quantize(exponent, rounding=rounding, context=context)
+        return '{:f}'.format(quantized) if coerce_to_string else quantized
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    # Resolved once per serializer instead of once per value.
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str):
+            return value
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _identity(value):
+    return value
+
+
+def _converter(field):
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, (serializers.ChoiceField, serializers.CharField)) and not getattr(field, 'choices', None):
+        return str
+    if isinstance(field, (serializers.IntegerField, serializers.PrimaryKeyRelatedField)):
+        return _identity
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: choices.get(str(value), value)
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """
+    Read-only rendering of .values() rows with the same output as a
+    ModelSerializer's to_representation().
+
+    The serializer's fields are bound once and reduced to one converter per
+    column, so each row costs a dict build rather than per-instance field
+    binding and attribute lookups.
+    """
+
+    def __init__(self, serializer_class):
+        fields = [field for field in serializer_class().fields.values() if not field.write_only]
+        self.columns = tuple(
+            (field.field_name, field.source, _converter(field)) for field in fields
+        )
+        self.value_fields = tuple(source for _, source, _ in self.columns)
+
+    def values(self, queryset):
+        return queryset.values(*self.value_fields)
+
+    def to_representation(self, row):
+        # Like Serializer.to_representation(), None is passed through untouched.
+        return {
+            name: None if row[source] is None else convert(row[source])
+            for name, source, convert in self.columns
+        }
+
+    def many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
@@ -0,0 +1,67 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import UserInvestmentAccount
+
+# Cached value for a (user, account) pair that has no grant row.
+NO_GRANT = False
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[settings.GRANT_CACHE_ALIAS]
+
+
+def _key(user_id, investment_account_id):
+    return f'grant:{user_id}:{investment_account_id}'
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def get_grant(user_id, investment_account_id):
+    # Grants change rarely but are read on every request, so the row (or the
+    # absence of one) is cached across requests and evicted by signals.
+    investment_account_id = int(investment_account_id)
+    key = _key(user_id, investment_account_id)
+    grant = _cache().get(key)
+    if grant is not None:
+        _count('hits')
+        return grant or None
+
+    _count('misses')
+    grant = UserInvestmentAccount.objects.filter(
+        user_id=user_id,
+        investment_account_id=investment_account_id
+    ).first()
+    _cache().set(key, grant or NO_GRANT)
+    return grant
+
+
+def invalidate(user_id, investment_account_id):
+    _cache().delete(_key(user_id, investment_account_id))
+
+
+def invalidate_many(pairs):
+    _cache().delete_many([_key(user_id, investment_account_id) for user_id, investment_account_id in pairs])
+
+
+def clear():
+    _cache().clear()
+
+
+def stats():
+    with _lock:
+        hits, misses = _counters['hits'], _counters['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
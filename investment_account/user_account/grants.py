@@ -0,0 +1,45 @@
+"""
+Granting many users access to many accounts at once.
+
+upsert_grants() writes every grant with one INSERT ... ON CONFLICT DO UPDATE
+on the (user, investment_account) unique constraint. bulk_create() sends no
+post_save signals, so the grant cache entries the signal handler would have
+evicted one at a time are evicted here for the whole batch.
+"""
+from django.db import transaction
+
+from . import grant_cache
+from .models import UserInvestmentAccount
+
+GRANT_FLAGS = ('can_view', 'can_create', 'can_update', 'can_delete')
+
+
+def upsert_grants(rows):
+    """
+    Create or replace the grant for each row's (user_id,
+    investment_account_id) pair; flags a row leaves out are revoked. A later
+    row for the same pair wins. Returns (created, updated).
+    """
+    grants = {}
+    for row in rows:
+        grants[row['user_id'], row['investment_account_id']] = UserInvestmentAccount(**row)
+    if not grants:
+        return 0, 0
+    pairs = list(grants)
+
+    with transaction.atomic():
+        existing = UserInvestmentAccount.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            investment_account_id__in={investment_account_id for _, investment_account_id in pairs},
+        ).values_list('user_id', 'investment_account_id')
+        updated = len(set(existing) & grants.keys())
+        UserInvestmentAccount.objects.bulk_create(
+            grants.values(),
+            update_conflicts=True,
+            unique_fields=['user', 'investment_account'],
+            update_fields=GRANT_FLAGS,
+        )
+        # Evict now and again on commit, as the post_save handler does.
+        grant_cache.invalidate_many(pairs)
+        transaction.on_commit(lambda: grant_cache.invalidate_many(pairs))
+    return len(pairs) - updated, updated
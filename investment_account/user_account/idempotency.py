@@ -0,0 +1,101 @@
+"""
+Idempotency-Key support for POST handlers.
+
+The first request with a key claims it by inserting a row. When the
+handler succeeds, the response is stored on that row. A retry with the
+same key gets the stored response back from a single read on the
+(user, key) unique index; validation and writes are not run again.
+"""
+import hashlib
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def request_fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _lookup(user_id, key):
+    try:
+        record = IdempotencyKey.objects.get(user_id=user_id, key=key)
+    except IdempotencyKey.DoesNotExist:
+        return None
+    if record.is_expired():
+        # Not purged yet; treat it as unseen.
+        record.delete()
+        return None
+    return record
+
+
+def _claim(user_id, key, fingerprint):
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(user_id=user_id, key=key, fingerprint=fingerprint)
+        return True
+    except IntegrityError:
+        # A concurrent request with the same key claimed it first.
+        return False
+
+
+def _release(user_id, key):
+    IdempotencyKey.objects.filter(user_id=user_id, key=key, status_code__isnull=True).delete()
+
+
+def _replay(record, fingerprint):
+    if record is None or record.status_code is None:
+        return Response(
+            {'error': 'A request with this Idempotency-Key is still being processed.'}, status=409
+        )
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': 'This Idempotency-Key was already used for a different request.'}, status=422
+        )
+    return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(handler):
+    """
+    Make a view handler honour an Idempotency-Key header.
+
+    Only successful responses are stored. When the handler fails, the
+    claim is released, so the client can retry with the same key.
+    """
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters.'}, status=400)
+
+        user_id = request.user.pk
+        fingerprint = request_fingerprint(request)
+        record = _lookup(user_id, key)
+        if record is not None or not _claim(user_id, key, fingerprint):
+            return _replay(record or _lookup(user_id, key), fingerprint)
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except BaseException:
+            _release(user_id, key)
+            raise
+        if 200 <= response.status_code < 300:
+            IdempotencyKey.objects.filter(user_id=user_id, key=key).update(
+                status_code=response.status_code, response_body=response.data
+            )
+        else:
+            _release(user_id, key)
+        return response
+
+    return wrapper
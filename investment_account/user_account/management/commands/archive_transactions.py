@@ -0,0 +1,27 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from user_account.archive import archive_transactions
+
+
+class Command(BaseCommand):
+    help = 'Move transactions older than the TRANSACTION_ARCHIVE horizon into the transaction archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', type=date.fromisoformat,
+            help='Archive transactions before the start of this day (YYYY-MM-DD). Defaults to, and may not be later than, the horizon.',
+        )
+        parser.add_argument('--batch-size', type=int, help='Transactions moved per database transaction.')
+
+    def handle(self, *args, **options):
+        before = options['before']
+        if before is not None:
+            before = timezone.make_aware(datetime.combine(before, time.min))
+        try:
+            accounts, transactions = archive_transactions(before, options['batch_size'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Archived {transactions} transactions from {accounts} accounts.'))
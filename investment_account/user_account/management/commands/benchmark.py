@@ -0,0 +1,129 @@
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from user_account import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and benchmark the API in-process, reporting '
+        'p50/p95/p99 latency, requests per second and queries per request. '
+        '--suite serializers instead times the transaction serializers without a database, and '
+        '--suite renderers compares the JSON renderers on the admin user-transactions response, and '
+        '--suite database compares concurrent read/write throughput under default and configured '
+        'database settings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', choices=['api', 'serializers', 'renderers', 'database'], default='api')
+        parser.add_argument('--rows', type=int, action='append',
+                            help='Row count for the serializers suite; repeat for several. Defaults to 10000 and 100000.')
+        parser.add_argument('--scenario', action='append', choices=sorted(benchmarks.API_SCENARIOS),
+                            help='Scenario to run; repeat for several. Defaults to all of them.')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Requests per scenario, or operations per thread for the database suite.')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads for the database suite.')
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads for the database suite.')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--accounts', type=int, default=100)
+        parser.add_argument('--grant-density', type=float, default=0.05)
+        parser.add_argument('--transactions-per-account', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--baseline', help='Compare against this baseline JSON file.')
+        parser.add_argument('--save-baseline', help='Write the results to this baseline JSON file.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown before a result counts as a regression.')
+
+    def handle(self, *args, **options):
+        if options['suite'] == 'serializers':
+            self.report_serializers(benchmarks.run_serializers(options['rows'] or [10000, 100000]))
+            return
+
+        scenarios = options['scenario'] or list(benchmarks.API_SCENARIOS)
+
+        setup_test_environment(debug=False)
+        if options['suite'] == 'database' and connection.vendor == 'sqlite':
+            # In-memory databases have no journal to tune and can't be shared by threads
+            # the way a file can, so the benchmark runs against a temporary file.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), f'benchmark-{os.getpid()}.sqlite3'
+            )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command(
+                'seed_data', stdout=self.stdout,
+                users=options['users'], accounts=options['accounts'],
+                grant_density=options['grant_density'],
+                transactions_per_account=options['transactions_per_account'],
+                seed=options['seed'],
+            )
+            if options['suite'] == 'renderers':
+                results = benchmarks.run_renderers(options['iterations'])
+            elif options['suite'] == 'database':
+                results = benchmarks.run_database(options['readers'], options['writers'], options['iterations'])
+            else:
+                results = benchmarks.run_api(scenarios, options['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['suite'] == 'renderers':
+            self.report_renderers(results)
+            return
+        if options['suite'] == 'database':
+            self.report_database(results)
+            return
+        self.report(results)
+
+        if options['save_baseline']:
+            benchmarks.save_baseline(options['save_baseline'], results)
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+        if options['baseline']:
+            regressions = benchmarks.compare(results, benchmarks.load_baseline(options['baseline']), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def report(self, results):
+        header = f"{'scenario':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<26}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['rps']:>10.1f}{result['queries_per_request']:>10.2f}"
+            )
+
+    def report_serializers(self, results):
+        header = f"{'rows':>10}{'drf ms':>12}{'values ms':>12}{'speedup':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for result in results.values():
+            self.stdout.write(
+                f"{result['rows']:>10}{result['drf_ms']:>12.2f}{result['values_ms']:>12.2f}{result['speedup']:>9.2f}x"
+            )
+
+    def report_renderers(self, results):
+        header = f"{'response':<26}{'rows':>8}{'bytes':>10}{'json ms':>10}{'orjson ms':>11}{'speedup':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<26}{result['rows']:>8}{result['bytes']:>10}{result['json_ms']:>10.2f}"
+                f"{result['orjson_ms']:>11.2f}{result['speedup']:>9.2f}x"
+            )
+
+    def report_database(self, results):
+        header = f"{'settings':<12}{'reads/s':>10}{'writes/s':>10}{'errors':>8}{'seconds':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<12}{result['reads_per_s']:>10.1f}{result['writes_per_s']:>10.1f}"
+                f"{result['errors']:>8}{result['seconds']:>10.2f}"
+            )
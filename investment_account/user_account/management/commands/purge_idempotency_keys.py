@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from user_account.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete Idempotency-Key records older than IDEMPOTENCY_KEY_TTL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of keys deleted per query.')
+
+    def handle(self, *args, **options):
+        purged = 0
+        while True:
+            # Batches walk the created_at index and keep each delete short.
+            batch = list(IdempotencyKey.objects.expired().order_by('created_at').values_list('pk', flat=True)[
+                :options['batch_size']
+            ])
+            if not batch:
+                break
+            IdempotencyKey.objects.filter(pk__in=batch).delete()
+            purged += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} idempotency keys.'))
@@ -0,0 +1,93 @@
+import heapq
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+from user_account.models import DailyAccountBalance, InvestmentAccount, Transaction, TransactionArchive
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-account daily balance rollup from the live and archived transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Number of accounts rebuilt per database transaction.')
+        parser.add_argument('--insert-batch-size', type=int, default=5000, help='Rollup rows written per INSERT.')
+
+    def handle(self, *args, **options):
+        account_ids = InvestmentAccount.objects.order_by('pk').values_list('pk', flat=True)
+        accounts = days = 0
+
+        batch = []
+        for account_id in account_ids.iterator():
+            batch.append(account_id)
+            if len(batch) == options['batch_size']:
+                days += self.rebuild(batch, options['insert_batch_size'])
+                accounts += len(batch)
+                batch = []
+        if batch:
+            days += self.rebuild(batch, options['insert_batch_size'])
+            accounts += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {days} daily rows for {accounts} accounts.'))
+
+    def daily_totals(self, model, account_ids):
+        zero = Decimal('0')
+        # Grouping by day happens in the database; only one row per account-day
+        # comes back, in the order the running balance needs.
+        return (
+            model.objects.filter(investment_account_id__in=account_ids)
+            .annotate(day=TruncDate('timestamp'))
+            .values('investment_account_id', 'day')
+            .annotate(
+                deposits=Coalesce(Sum('amount', filter=Q(transaction_type='deposit')), zero),
+                withdrawals=Coalesce(Sum('amount', filter=Q(transaction_type='withdrawal')), zero),
+            )
+            .order_by('investment_account_id', 'day')
+            .iterator()
+        )
+
+    def merged_totals(self, account_ids):
+        # Both tables come back in (account, day) order, so they merge in one
+        # pass; a day split across them is summed.
+        key = itemgetter('investment_account_id', 'day')
+        merged = heapq.merge(
+            self.daily_totals(TransactionArchive, account_ids), self.daily_totals(Transaction, account_ids), key=key
+        )
+        for (investment_account_id, day), rows in groupby(merged, key=key):
+            rows = list(rows)
+            yield {
+                'investment_account_id': investment_account_id,
+                'day': day,
+                'deposits': sum(row['deposits'] for row in rows),
+                'withdrawals': sum(row['withdrawals'] for row in rows),
+            }
+
+    def rebuild(self, account_ids, insert_batch_size):
+        zero = Decimal('0')
+        with transaction.atomic():
+            DailyAccountBalance.objects.filter(investment_account_id__in=account_ids).delete()
+            rows, written = [], 0
+            current_account, closing_balance = None, zero
+            for row in self.merged_totals(account_ids):
+                if row['investment_account_id'] != current_account:
+                    current_account, closing_balance = row['investment_account_id'], zero
+                closing_balance += row['deposits'] - row['withdrawals']
+                rows.append(DailyAccountBalance(
+                    investment_account_id=current_account,
+                    day=row['day'],
+                    deposits=row['deposits'],
+                    withdrawals=row['withdrawals'],
+                    closing_balance=closing_balance,
+                ))
+                if len(rows) == insert_batch_size:
+                    DailyAccountBalance.objects.bulk_create(rows)
+                    written += len(rows)
+                    rows = []
+            DailyAccountBalance.objects.bulk_create(rows)
+            written += len(rows)
+        return written
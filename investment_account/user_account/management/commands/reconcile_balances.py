@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from user_account.models import ArchivedBalance, InvestmentAccount, Transaction, signed_total
+
+
+class Command(BaseCommand):
+    help = 'Recompute materialized account balances from their transactions and report any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of accounts reconciled per query.')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without correcting it.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_pk = 0
+
+        while True:
+            with transaction.atomic():
+                # Lock the batch so writes landing mid-reconcile cannot be overwritten.
+                accounts = list(
+                    InvestmentAccount.objects.select_for_update()
+                    .filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .only('pk', 'balance', 'opening_balance')[:batch_size]
+                )
+                if not accounts:
+                    break
+                last_pk = accounts[-1].pk
+
+                # The per-account sums are grouped in the database, so memory stays
+                # bounded by the batch size however many transactions there are.
+                totals = dict(
+                    Transaction.objects.filter(investment_account_id__in=[account.pk for account in accounts])
+                    .values('investment_account_id')
+                    .annotate(total=signed_total())
+                    .values_list('investment_account_id', 'total')
+                )
+                # Archived transactions count through their carry-forward rows.
+                carried = dict(
+                    ArchivedBalance.objects.filter(investment_account_id__in=[account.pk for account in accounts])
+                    .values_list('investment_account_id', F('deposits') - F('withdrawals'))
+                )
+
+                stale = []
+                for account in accounts:
+                    expected = account.opening_balance + totals.get(account.pk, 0) + carried.get(account.pk, 0)
+                    if account.balance != expected:
+                        self.stdout.write(
+                            f'Account {account.pk}: stored {account.balance}, expected {expected} '
+                            f'(drift {account.balance - expected})'
+                        )
+                        account.balance = expected
+                        stale.append(account)
+
+                if stale and not options['dry_run']:
+                    # updated_at is the accounts' HTTP validator, so a corrected
+                    # balance must stamp it like any other balance change.
+                    now = timezone.now()
+                    for account in stale:
+                        account.updated_at = now
+                    InvestmentAccount.objects.bulk_update(stale, ['balance', 'updated_at'])
+
+                checked += len(accounts)
+                drifted += len(stale)
+
+        action = 'found' if options['dry_run'] else 'corrected'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} accounts, {action} drift on {drifted}.'))
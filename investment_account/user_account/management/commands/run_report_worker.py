@@ -0,0 +1,95 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user_account import reports
+
+
+class InlineExecutor:
+    # Runs each job in this process, for --processes 0.
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Generate queued admin reports, several at a time in a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.REPORT_JOBS['PROCESSES'],
+            help='Reports generated in parallel. 0 runs them one at a time in this process.',
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+        parser.add_argument('--poll-interval', type=float, default=settings.REPORT_JOBS['POLL_INTERVAL'],
+                            help='Seconds to wait for the queue or a running job before checking again.')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+
+        def make_executor():
+            if not processes:
+                return InlineExecutor()
+            # Spawned rather than forked, so no process shares this one's
+            # database connections; each sets Django up before its first job.
+            return ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+            )
+
+        self.work(make_executor, max(processes, 1), options['poll_interval'], options['once'])
+
+    def work(self, make_executor, slots, poll_interval, once):
+        executor = make_executor()
+        running = {}
+        try:
+            while True:
+                purged = reports.purge_expired()
+                if purged:
+                    self.stdout.write(f'Purged {purged} expired reports.')
+                for job_id in reports.claim_jobs(slots - len(running)):
+                    running[executor.submit(reports.run_job, job_id)] = job_id
+
+                if not running:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+
+                finished, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    job_id = running.pop(future)
+                    self.report(job_id, future)
+                    broken = broken or isinstance(future.exception(), BrokenProcessPool)
+
+                if broken:
+                    # A child that dies takes the whole pool down, along with
+                    # every job still in it. Those jobs are failed rather than
+                    # left running until STALE_AFTER, and a new pool takes over.
+                    for future, job_id in running.items():
+                        self.report(job_id, future)
+                    running.clear()
+                    executor.shutdown(wait=False)
+                    executor = make_executor()
+        finally:
+            executor.shutdown()
+
+    def report(self, job_id, future):
+        try:
+            outcome = future.result()
+        except Exception as exc:
+            reports.fail_job(job_id, exc)
+            outcome = f'failed ({type(exc).__name__}: {exc})'
+        self.stdout.write(f'Report {job_id}: {outcome}')
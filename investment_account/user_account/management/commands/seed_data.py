@@ -0,0 +1,103 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from user_account.models import InvestmentAccount, Transaction, UserInvestmentAccount
+
+
+def create_backdated(rows, timestamps, batch_size):
+    # auto_now_add stamps every row with the current time on insert, so the
+    # past timestamps are written over them in a second pass. bulk_update
+    # builds one CASE per statement, so it is kept to small batches.
+    created = Transaction.objects.bulk_create(rows)
+    for item, timestamp in zip(created, timestamps):
+        item.timestamp = timestamp
+    Transaction.objects.bulk_update(created, ['timestamp'], batch_size=min(batch_size, 500))
+    return len(created)
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset of users, accounts, permission grants and transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--accounts', type=int, default=200)
+        parser.add_argument('--grant-density', type=float, default=0.05,
+                            help='Fraction of accounts each user is granted access to.')
+        parser.add_argument('--transactions-per-account', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365, help='Spread transactions over this many past days.')
+        parser.add_argument('--withdrawal-ratio', type=float, default=0.3)
+        parser.add_argument('--prefix', default='seed', help='Prefix for generated usernames and account numbers.')
+        parser.add_argument('--password', default='password123', help='Password shared by every generated user.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a reproducible dataset.')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['grant_density'] <= 1:
+            raise CommandError('--grant-density must be between 0 and 1.')
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            # Hashing is deliberately slow, so every user shares one hash.
+            password = make_password(options['password'])
+            users = User.objects.bulk_create([
+                User(username=f'{prefix}-user-{n}', password=password)
+                for n in range(options['users'])
+            ], batch_size=batch_size)
+
+            accounts = InvestmentAccount.objects.bulk_create([
+                InvestmentAccount(
+                    account_name=f'{prefix} account {n}',
+                    account_number=f'{prefix[:8]}{n:010d}',
+                    balance=Decimal('0.00'),
+                    opening_balance=Decimal('0.00'),
+                )
+                for n in range(options['accounts'])
+            ], batch_size=batch_size)
+
+            grants_per_user = max(1, round(len(accounts) * options['grant_density'])) if accounts else 0
+            grants = []
+            for user in users:
+                for account in rng.sample(accounts, grants_per_user):
+                    flags = rng.random()
+                    grants.append(UserInvestmentAccount(
+                        user=user, investment_account=account,
+                        can_view=True,
+                        can_create=flags < 0.7,
+                        can_update=flags < 0.3,
+                        can_delete=flags < 0.1,
+                    ))
+            UserInvestmentAccount.objects.bulk_create(grants, batch_size=batch_size)
+
+            now = timezone.now()
+            window = timedelta(days=options['days']).total_seconds()
+            created = 0
+            for account in accounts:
+                rows, timestamps, net = [], [], Decimal('0.00')
+                for _ in range(options['transactions_per_account']):
+                    transaction_type = 'withdrawal' if rng.random() < options['withdrawal_ratio'] else 'deposit'
+                    amount = Decimal(rng.randint(100, 500000)) / 100
+                    net += -amount if transaction_type == 'withdrawal' else amount
+                    rows.append(Transaction(investment_account=account, transaction_type=transaction_type, amount=amount))
+                    timestamps.append(now - timedelta(seconds=rng.random() * window))
+                    if len(rows) == batch_size:
+                        created += create_backdated(rows, timestamps, batch_size)
+                        rows, timestamps = [], []
+                created += create_backdated(rows, timestamps, batch_size)
+                account.balance = net
+                account.updated_at = now
+            InvestmentAccount.objects.bulk_update(accounts, ['balance', 'updated_at'], batch_size=batch_size)
+
+        call_command('rebuild_daily_balances', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users, {len(accounts)} accounts, {len(grants)} grants and {created} transactions.'
+        ))
@@ -0,0 +1,187 @@
+import logging
+import random
+import threading
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    """
+    In-process totals per (view, action), shared by every request thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, key, queries, db_ms, serialize_ms, render_ms, total_ms):
+        with self._lock:
+            entry = self._endpoints.setdefault(key, {
+                'requests': 0, 'queries': 0, 'db_ms': 0.0, 'serialize_ms': 0.0, 'render_ms': 0.0,
+                'total_ms': 0.0, 'max_ms': 0.0,
+            })
+            entry['requests'] += 1
+            entry['queries'] += queries
+            entry['db_ms'] += db_ms
+            entry['serialize_ms'] += serialize_ms
+            entry['render_ms'] += render_ms
+            entry['total_ms'] += total_ms
+            entry['max_ms'] = max(entry['max_ms'], total_ms)
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {key: dict(entry) for key, entry in self._endpoints.items()}
+        rows = []
+        for (view, action), entry in sorted(endpoints.items()):
+            count = entry['requests']
+            rows.append({
+                'view': view,
+                'action': action,
+                'requests': count,
+                'avg_queries': entry['queries'] / count,
+                'avg_db_ms': entry['db_ms'] / count,
+                'avg_serialize_ms': entry['serialize_ms'] / count,
+                'avg_render_ms': entry['render_ms'] / count,
+                'avg_total_ms': entry['total_ms'] / count,
+                'max_total_ms': entry['max_ms'],
+            })
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+request_stats = RequestStats()
+
+
+@contextmanager
+def serialize_time(request):
+    # Views wrap the code that builds response data from rows or instances;
+    # its time is reported as serialize. Unsampled requests record nothing.
+    metrics = getattr(request, '_metrics', None)
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics['serialize'] += perf_counter() - started
+
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Records SQL query count, DB time, serialization time, render time and
+    wall time for a sample of requests. Serialization is timed where views
+    wrap it in serialize_time(): the account and transaction list and detail
+    reads and the admin user-transactions view. The numbers are returned in a Server-Timing header and added
+    to request_stats under the resolved view and viewset action.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        request._metrics = {'key': None, 'serialize': 0.0, 'render': 0.0}
+        start = perf_counter()
+        with ExitStack() as stack:
+            self.wrap_connections(stack, timer)
+            response = self.get_response(request)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        request._metrics = {'key': None, 'serialize': 0.0, 'render': 0.0}
+        start = perf_counter()
+        # The async ORM runs queries on the request's sync thread, which has
+        # its own connections, so the wrappers are installed there.
+        stack = ExitStack()
+        await sync_to_async(self.wrap_connections)(stack, timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, timer, start)
+
+    def sampled(self):
+        return random.random() < settings.REQUEST_METRICS['SAMPLE_RATE']
+
+    def wrap_connections(self, stack, timer):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+
+    def finish(self, request, response, timer, start):
+        total_ms = (perf_counter() - start) * 1000
+        db_ms = timer.duration * 1000
+        serialize_ms = request._metrics['serialize'] * 1000
+        render_ms = request._metrics['render'] * 1000
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.2f};desc="{timer.count} queries"',
+            f'serialize;dur={serialize_ms:.2f}',
+            f'render;dur={render_ms:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+        key = request._metrics['key']
+        if key is not None:
+            request_stats.record(key, timer.count, db_ms, serialize_ms, render_ms, total_ms)
+        if total_ms >= settings.REQUEST_METRICS['SLOW_REQUEST_MS']:
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms total, %d queries in %.1f ms',
+                request.method, request.path, key, total_ms, timer.count, db_ms,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(request, '_metrics'):
+            return None
+        # Viewsets map HTTP methods to actions; plain views have none.
+        actions = getattr(view_func, 'actions', None) or {}
+        request._metrics['key'] = (request.resolver_match.view_name, actions.get(request.method.lower(), ''))
+        return None
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that rendering.
+        # Serializer .data built inside the view is part of the view's time.
+        if hasattr(request, '_metrics'):
+            started = perf_counter()
+
+            def rendered(response):
+                request._metrics['render'] += perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
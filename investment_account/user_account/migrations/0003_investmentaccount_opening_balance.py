@@ -0,0 +1,47 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:56
+
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, When
+
+
+def materialize_balances(apps, schema_editor):
+    # Balances were never updated by transactions, so the stored value is the
+    # opening balance and the running balance adds every signed transaction.
+    InvestmentAccount = apps.get_model('user_account', 'InvestmentAccount')
+    Transaction = apps.get_model('user_account', 'Transaction')
+    signed_amount = Case(
+        When(transaction_type='withdrawal', then=-F('amount')),
+        default=F('amount'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    totals = dict(
+        Transaction.objects.values('investment_account_id')
+        .annotate(total=Sum(signed_amount))
+        .values_list('investment_account_id', 'total')
+    )
+    accounts = list(InvestmentAccount.objects.all())
+    for account in accounts:
+        account.opening_balance = account.balance
+        account.balance = account.balance + (totals.get(account.pk) or 0)
+    InvestmentAccount.objects.bulk_update(accounts, ['opening_balance', 'balance'])
+
+
+def restore_balances(apps, schema_editor):
+    InvestmentAccount = apps.get_model('user_account', 'InvestmentAccount')
+    InvestmentAccount.objects.update(balance=F('opening_balance'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_account', '0002_remove_userinvestmentaccount_role_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='investmentaccount',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(materialize_balances, restore_balances),
+    ]
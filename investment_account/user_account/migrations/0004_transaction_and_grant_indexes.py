@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('user_account', '0003_investmentaccount_opening_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['investment_account', 'timestamp'], name='txn_account_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userinvestmentaccount',
+            index=models.Index(condition=models.Q(('can_view', True)), fields=['user', 'investment_account'], name='uia_viewable_idx'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='investment_account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='user_account.investmentaccount'),
+        ),
+        migrations.AlterField(
+            model_name='userinvestmentaccount',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_account', '0004_transaction_and_grant_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAccountBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('deposits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('withdrawals', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('closing_balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('investment_account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='user_account.investmentaccount')),
+            ],
+            options={
+                'unique_together': {('investment_account', 'day')},
+            },
+        ),
+    ]
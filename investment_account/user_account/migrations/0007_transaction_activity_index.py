@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_account', '0006_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['investment_account', 'timestamp', 'id', 'transaction_type', 'amount'], name='txn_account_activity_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='txn_account_timestamp_idx',
+        ),
+    ]
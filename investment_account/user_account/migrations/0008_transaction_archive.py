@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_account', '0007_transaction_activity_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBalance',
+            fields=[
+                ('investment_account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='user_account.investmentaccount')),
+                ('archived_before', models.DateTimeField()),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('deposits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('withdrawals', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_activity', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('transaction_type', models.CharField(choices=[('deposit', 'Deposit'), ('withdrawal', 'Withdrawal')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('timestamp', models.DateTimeField()),
+                ('investment_account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='user_account.investmentaccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['investment_account', 'timestamp', 'id', 'transaction_type', 'amount'], name='txn_archive_activity_idx')],
+            },
+        ),
+    ]
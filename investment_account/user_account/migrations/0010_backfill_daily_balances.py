@@ -0,0 +1,67 @@
+import heapq
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import migrations
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def daily_totals(model):
+    zero = Decimal('0')
+    return (
+        model.objects.annotate(day=TruncDate('timestamp'))
+        .values('investment_account_id', 'day')
+        .annotate(
+            deposits=Coalesce(Sum('amount', filter=Q(transaction_type='deposit')), zero),
+            withdrawals=Coalesce(Sum('amount', filter=Q(transaction_type='withdrawal')), zero),
+        )
+        .order_by('investment_account_id', 'day')
+        .iterator()
+    )
+
+
+def backfill_daily_balances(apps, schema_editor, insert_batch_size=5000):
+    # 0005 created the rollup empty, and only writes after it kept it up to
+    # date. Rebuild it from every live and archived transaction so existing
+    # deployments don't serve balance history from a partial table. This
+    # mirrors the rebuild_daily_balances command with the historical models.
+    Transaction = apps.get_model('user_account', 'Transaction')
+    TransactionArchive = apps.get_model('user_account', 'TransactionArchive')
+    DailyAccountBalance = apps.get_model('user_account', 'DailyAccountBalance')
+
+    DailyAccountBalance.objects.all().delete()
+    key = itemgetter('investment_account_id', 'day')
+    merged = heapq.merge(daily_totals(TransactionArchive), daily_totals(Transaction), key=key)
+
+    rows, current_account, closing_balance = [], None, Decimal('0')
+    for (investment_account_id, day), totals in groupby(merged, key=key):
+        totals = list(totals)
+        deposits = sum(row['deposits'] for row in totals)
+        withdrawals = sum(row['withdrawals'] for row in totals)
+        if investment_account_id != current_account:
+            current_account, closing_balance = investment_account_id, Decimal('0')
+        closing_balance += deposits - withdrawals
+        rows.append(DailyAccountBalance(
+            investment_account_id=investment_account_id,
+            day=day,
+            deposits=deposits,
+            withdrawals=withdrawals,
+            closing_balance=closing_balance,
+        ))
+        if len(rows) == insert_batch_size:
+            DailyAccountBalance.objects.bulk_create(rows)
+            rows = []
+    DailyAccountBalance.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_account', '0009_reportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_balances, migrations.RunPython.noop),
+    ]
@@ -1,25 +1,161 @@
-from django.db import models
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.utils import timezone
+from django.db.models import Case, Count, DecimalField, F, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 
 # Create your models here.
 
 
+def signed_amount(prefix=''):
+    # Deposits count as positive and withdrawals as negative amounts.
+    return Case(
+        When(**{f'{prefix}transaction_type': 'withdrawal'}, then=-F(f'{prefix}amount')),
+        default=F(f'{prefix}amount'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def signed_total(prefix=''):
+    return Coalesce(
+        Sum(signed_amount(prefix)),
+        Value(Decimal('0')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def signed_value(transaction_type, amount):
+    return -amount if transaction_type == 'withdrawal' else amount
+
+
+def apply_transaction_effects(account_id, transaction_type, amount, timestamp, reverse=False):
+    # Keeps the running balance and the daily rollup in step with a written
+    # (or, with reverse=True, removed) transaction.
+    if reverse:
+        amount = -amount
+    InvestmentAccount.objects.adjust_balance(account_id, signed_value(transaction_type, amount))
+    DailyAccountBalance.objects.record(account_id, timezone.localdate(timestamp), **{
+        'withdrawals' if transaction_type == 'withdrawal' else 'deposits': amount
+    })
+
+
+class InvestmentAccountQuerySet(models.QuerySet):
+    def with_total_balance(self):
+        # The balance is maintained at write time, so the transaction total is
+        # its distance from the opening balance and needs no join.
+        return self.annotate(total_balance=F('balance') - F('opening_balance'))
+
+    def with_balance_history(self, as_of, start_date=None, end_date=None):
+        # Answered from the daily rollup: one index seek for the closing
+        # balance and a scan over the days in range, never the transactions.
+        amount = DecimalField(max_digits=14, decimal_places=2)
+        zero = Value(Decimal('0'))
+        days = models.Q(dailyaccountbalance__day__lte=end_date or as_of)
+        if start_date:
+            days &= models.Q(dailyaccountbalance__day__gte=start_date)
+        closing_balance = DailyAccountBalance.objects.filter(
+            investment_account=models.OuterRef('pk'), day__lte=as_of
+        ).order_by('-day').values('closing_balance')[:1]
+        return self.annotate(
+            balance_as_of=F('opening_balance') + Coalesce(models.Subquery(closing_balance), zero, output_field=amount),
+            deposits=Coalesce(Sum('dailyaccountbalance__deposits', filter=days), zero, output_field=amount),
+            withdrawals=Coalesce(Sum('dailyaccountbalance__withdrawals', filter=days), zero, output_field=amount),
+        ).annotate(net_flow=F('deposits') - F('withdrawals'))
+
+    def viewable_by(self, user):
+        # One grant row per (user, account), so the join never multiplies accounts.
+        return self.filter(userinvestmentaccount__user=user, userinvestmentaccount__can_view=True)
+
+    def with_activity(self, start_date=None, end_date=None):
+        # One correlated subquery per figure, each answered from a covering
+        # index for its account alone; joining and grouping every transaction
+        # costs a temporary B-tree instead. Archived transactions are added
+        # from the carry-forward row when there is no window, and from the
+        # archive when the window reaches back before archive_horizon().
+        window = models.Q()
+        if start_date is not None:
+            window &= models.Q(timestamp__gte=start_date)
+        if end_date is not None:
+            window &= models.Q(timestamp__lte=end_date)
+        amount = DecimalField(max_digits=14, decimal_places=2)
+        zero = Value(Decimal('0'))
+
+        def per_account(model, aggregate, where=models.Q()):
+            rows = model.objects.filter(window, where, investment_account=OuterRef('pk'))
+            return Subquery(rows.order_by().values('investment_account').annotate(value=aggregate).values('value'))
+
+        def activity(model):
+            return (
+                Coalesce(per_account(model, Count('pk')), 0),
+                per_account(model, Max('timestamp')),
+                Coalesce(per_account(model, Sum('amount'), models.Q(transaction_type='deposit')), zero, output_field=amount),
+                Coalesce(per_account(model, Sum('amount'), models.Q(transaction_type='withdrawal')), zero, output_field=amount),
+            )
+
+        count, last_activity, deposits, withdrawals = activity(Transaction)
+        if start_date is None and end_date is None:
+            archived = (
+                Coalesce(F('archivedbalance__transaction_count'), 0),
+                F('archivedbalance__last_activity'),
+                Coalesce(F('archivedbalance__deposits'), zero, output_field=amount),
+                Coalesce(F('archivedbalance__withdrawals'), zero, output_field=amount),
+            )
+        elif start_date is None or start_date < archive_horizon():
+            archived = activity(TransactionArchive)
+        else:
+            archived = None
+        if archived:
+            # Every archived transaction predates every live one.
+            count, last_activity = count + archived[0], Coalesce(last_activity, archived[1])
+            deposits, withdrawals = deposits + archived[2], withdrawals + archived[3]
+
+        return self.annotate(
+            transaction_count=count, last_activity=last_activity, deposits=deposits, withdrawals=withdrawals
+        )
+
+    def adjust_balance(self, account_id, delta):
+        return self.filter(pk=account_id).update(
+            balance=F('balance') + delta,
+            updated_at=timezone.now(),
+        )
+
+
 class InvestmentAccount(models.Model):
     account_name = models.CharField(max_length=255)
     account_number = models.CharField(max_length=20, unique=True)
     balance = models.DecimalField(max_digits=12, decimal_places=2)
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = InvestmentAccountQuerySet.as_manager()
+
     def __str__(self):
         return self.account_name
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.opening_balance = self.balance
+        elif kwargs.get('update_fields') is None:
+            # balance is maintained with F() updates by adjust_balance(); a
+            # stale instance must not write its copy back.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('balance', 'opening_balance')
+            ]
+        super().save(*args, **kwargs)
+
     def get_total_balance(self):
-        return self.transaction_set.aggregate(Sum('amount'))['amount__sum'] or 0
+        return self.balance - self.opening_balance
 
 class UserInvestmentAccount(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # user_id lookups use the leading column of the unique_together index.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     investment_account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE)
 
     can_view = models.BooleanField(default=False)   
@@ -29,20 +165,271 @@ class UserInvestmentAccount(models.Model):
 
     class Meta:
         unique_together = ('user', 'investment_account')
+        # The per-request grant lookup is served by the unique_together index.
+        indexes = [
+            # Only the rows that let a user see an account, for per-user listings.
+            models.Index(
+                fields=['user', 'investment_account'],
+                condition=models.Q(can_view=True),
+                name='uia_viewable_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.investment_account.account_name}"
 
+class TransactionQuerySet(models.QuerySet):
+    def bulk_post(self, investment_account_id, transactions, batch_size=None):
+        # bulk_create() skips save(), so the net balance change and the daily
+        # totals are applied once per batch here.
+        with transaction.atomic():
+            created = self.bulk_create(transactions, batch_size=batch_size)
+            InvestmentAccount.objects.adjust_balance(
+                investment_account_id, sum((item.signed_amount for item in created), Decimal('0'))
+            )
+            days = {}
+            for item in created:
+                totals = days.setdefault(timezone.localdate(item.timestamp), {'deposits': 0, 'withdrawals': 0})
+                totals['withdrawals' if item.transaction_type == 'withdrawal' else 'deposits'] += item.decimal_amount
+            for day, totals in days.items():
+                DailyAccountBalance.objects.record(investment_account_id, day, **totals)
+        return created
+
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
         ('deposit', 'Deposit'),
         ('withdrawal', 'Withdrawal'),
     )
 
-    investment_account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE)
+    # Account lookups use the leading column of txn_account_activity_idx.
+    investment_account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, db_index=False)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Per-account listings and date-range filters, ordered by (timestamp, id).
+            # The trailing columns let per-account activity totals read the
+            # index alone.
+            models.Index(
+                fields=['investment_account', 'timestamp', 'id', 'transaction_type', 'amount'],
+                name='txn_account_activity_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type.capitalize()} of {self.amount} on {self.investment_account.account_name}"
+
+    @property
+    def decimal_amount(self):
+        return self._meta.get_field('amount').to_python(self.amount)
+
+    @property
+    def signed_amount(self):
+        return signed_value(self.transaction_type, self.decimal_amount)
+
+    def _stored_values(self):
+        # Lock the stored row so concurrent edits apply their deltas in turn.
+        return Transaction.objects.select_for_update().filter(pk=self.pk).values_list(
+            'investment_account_id', 'transaction_type', 'amount', 'timestamp'
+        ).first()
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            stored = None if self._state.adding else self._stored_values()
+            super().save(*args, **kwargs)
+            if stored:
+                apply_transaction_effects(*stored, reverse=True)
+            apply_transaction_effects(self.investment_account_id, self.transaction_type, self.decimal_amount, self.timestamp)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            stored = self._stored_values()
+            result = super().delete(*args, **kwargs)
+            if stored:
+                apply_transaction_effects(*stored, reverse=True)
+        return result
+
+
+class DailyAccountBalanceQuerySet(models.QuerySet):
+    def record(self, investment_account_id, day, deposits=0, withdrawals=0):
+        rows = self.filter(investment_account_id=investment_account_id)
+        updated = rows.filter(day=day).update(
+            deposits=F('deposits') + deposits,
+            withdrawals=F('withdrawals') + withdrawals,
+        )
+        if not updated:
+            opening = rows.filter(day__lt=day).order_by('-day').values_list('closing_balance', flat=True).first()
+            try:
+                with transaction.atomic():
+                    self.create(
+                        investment_account_id=investment_account_id, day=day,
+                        deposits=deposits, withdrawals=withdrawals, closing_balance=opening or 0
+                    )
+            except IntegrityError:
+                # Another writer created the day first; add to its row instead.
+                rows.filter(day=day).update(
+                    deposits=F('deposits') + deposits,
+                    withdrawals=F('withdrawals') + withdrawals,
+                )
+        # Closing balances are cumulative, so this day and every later one move together.
+        net = deposits - withdrawals
+        if net:
+            rows.filter(day__gte=day).update(closing_balance=F('closing_balance') + net)
+
+
+class DailyAccountBalance(models.Model):
+    # Account lookups use the leading column of the unique_together index.
+    investment_account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    deposits = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    withdrawals = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Net of every transaction up to the end of the day, excluding the opening balance.
+    closing_balance = models.DecimalField(max_digits=14, decimal_places=2)
+
+    objects = DailyAccountBalanceQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('investment_account', 'day')
+
+    def __str__(self):
+        return f"{self.investment_account_id} on {self.day}: {self.closing_balance}"
+
+
+def archive_horizon(now=None):
+    # Transactions before the start of this day may have been moved to
+    # TransactionArchive. archive_transactions never archives past it, so a
+    # read starting at or after it can skip the archive.
+    today = timezone.localdate(now)
+    day = today - timedelta(days=settings.TRANSACTION_ARCHIVE['HORIZON_DAYS'])
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class TransactionArchive(models.Model):
+    """
+    Transactions moved out of Transaction by archive_transactions.
+
+    Rows keep their ids and columns, so readers can union the two tables.
+    Archived history is read-only; the daily rollup and the materialized
+    balance already include it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    # Account lookups use the leading column of txn_archive_activity_idx.
+    investment_account = models.ForeignKey(InvestmentAccount, on_delete=models.CASCADE, db_index=False)
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Same layout as txn_account_activity_idx.
+            models.Index(
+                fields=['investment_account', 'timestamp', 'id', 'transaction_type', 'amount'],
+                name='txn_archive_activity_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.transaction_type} of {self.amount} on account {self.investment_account_id}"
+
+
+class ArchivedBalance(models.Model):
+    # Carry-forward totals of an account's archived transactions, so
+    # whole-history figures don't have to scan the archive.
+    investment_account = models.OneToOneField(InvestmentAccount, on_delete=models.CASCADE, primary_key=True)
+    # Every transaction of the account before this is archived.
+    archived_before = models.DateTimeField()
+    transaction_count = models.PositiveIntegerField(default=0)
+    deposits = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    withdrawals = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_activity = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.investment_account_id} before {self.archived_before}: {self.net}"
+
+    @property
+    def net(self):
+        return self.deposits - self.withdrawals
+
+
+def idempotency_cutoff(now=None):
+    # Keys created before this are past IDEMPOTENCY_KEY_TTL.
+    return (now or timezone.now()) - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self, now=None):
+        return self.filter(created_at__lt=idempotency_cutoff(now))
+
+
+class IdempotencyKey(models.Model):
+    # User lookups use the leading column of the unique_together index.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    key = models.CharField(max_length=255)
+    # Hash of the method, path and body the key was first used with.
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request with this key is still running.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
+
+    def is_expired(self, now=None):
+        return self.created_at < idempotency_cutoff(now)
+
+
+class ReportJob(models.Model):
+    """
+    An admin report on one user's accounts and transactions, generated by
+    the run_report_worker command and stored as gzipped JSON.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    start_date = models.DateTimeField(null=True)
+    end_date = models.DateTimeField(null=True)
+    # Hash of the user, the range and the state of the user's accounts when
+    # requested; unique among jobs that haven't failed, so identical requests
+    # share one job until the accounts change.
+    dedupe_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    result = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=~models.Q(status='failed'), name='report_job_dedupe'
+            ),
+        ]
+        indexes = [
+            # The worker's queue scan.
+            models.Index(fields=['status', 'created_at'], name='report_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Report {self.pk} for {self.user_id} ({self.status})"
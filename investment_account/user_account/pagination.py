@@ -0,0 +1,111 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(position):
+    timestamp, pk = position
+    raw = f'{timestamp.isoformat()}|{pk}'
+    return urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, pk = urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise NotFound('Invalid cursor')
+
+
+def position_of(row):
+    # Pages may hold model instances or plain .values() rows.
+    if isinstance(row, dict):
+        return row['timestamp'], row['id']
+    return row.timestamp, row.pk
+
+
+def after_position(queryset, position):
+    # Written as a range on timestamp plus a tie-breaker on id so the
+    # (investment_account, timestamp) index can seek straight to the cursor.
+    timestamp, pk = position
+    if hasattr(queryset, 'since'):
+        # A TransactionHistory drops the archive once the cursor is past it.
+        queryset = queryset.since(timestamp)
+    return queryset.filter(Q(timestamp__gte=timestamp), Q(timestamp__gt=timestamp) | Q(pk__gt=pk))
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination over (timestamp, id).
+
+    Each page seeks past the last row of the previous one instead of using an
+    OFFSET, so fetching page 1000 costs the same as fetching page 1.
+    """
+    ordering = ('timestamp', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        page_size = settings.TRANSACTION_PAGE_SIZE
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        if requested <= 0:
+            return page_size
+        return min(requested, settings.TRANSACTION_MAX_PAGE_SIZE)
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = after_position(queryset, decode_cursor(cursor))
+        # One extra row tells us whether another page exists.
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.finish_page([row async for row in self.page_queryset(queryset, request).aiterator()])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
@@ -1,43 +1,51 @@
 from rest_framework.permissions import BasePermission
-from .models import UserInvestmentAccount, Transaction, InvestmentAccount
+from . import grant_cache
+
+
+def get_account_grant(request, investment_account_id):
+    # The user's grant row is loaded once and memoized on the underlying
+    # HttpRequest, so permission classes and the view share a single lookup.
+    if not investment_account_id or not request.user.is_authenticated:
+        return None
+    http_request = getattr(request, '_request', request)
+    grants = getattr(http_request, '_account_grants', None)
+    if grants is None:
+        grants = http_request._account_grants = {}
+    key = str(investment_account_id)
+    if key not in grants:
+        try:
+            grants[key] = grant_cache.get_grant(request.user.pk, investment_account_id)
+        except (TypeError, ValueError):
+            grants[key] = None
+    return grants[key]
+
+
+def account_pk(view):
+    # Nested transaction routes name the account investment_account_pk; a view
+    # routed on the account itself sets account_url_kwarg = 'pk'.
+    return view.kwargs.get(getattr(view, 'account_url_kwarg', 'investment_account_pk'))
+
 
 class IsAllowedToView(BasePermission):
     def has_permission(self, request, view):
-        investment_account_id = view.kwargs.get('investment_account_pk')
-        if not investment_account_id:
-            return False
-        return request.user.userinvestmentaccount_set.filter(
-            investment_account_id=investment_account_id,
-            can_view=True
-        ).exists()
+        grant = get_account_grant(request, account_pk(view))
+        return bool(grant and grant.can_view)
 
 
 class IsAllowedToCreate(BasePermission):
     def has_permission(self, request, view):
-        investment_account_id = view.kwargs.get('investment_account_pk')
-        if not investment_account_id:
-            return False
-        return request.user.userinvestmentaccount_set.filter(
-            investment_account_id=investment_account_id,
-            can_create=True
-        ).exists()
+        grant = get_account_grant(request, account_pk(view))
+        return bool(grant and grant.can_create)
 
 
 class IsAllowedToUpdateDelete(BasePermission):
     def has_permission(self, request, view):
-        investment_account_id = view.kwargs.get('investment_account_pk')
-        if not investment_account_id:
+        grant = get_account_grant(request, account_pk(view))
+        if not grant:
             return False
         if request.method == 'DELETE':
-            return request.user.userinvestmentaccount_set.filter(
-                investment_account_id=investment_account_id,
-                can_delete=True
-            ).exists()
-        else:
-            return request.user.userinvestmentaccount_set.filter(
-                investment_account_id=investment_account_id,
-                can_update=True
-            ).exists()
+            return grant.can_delete
+        return grant.can_update
 
 
 
@@ -45,6 +53,3 @@ class IsAllowedToUpdateDelete(BasePermission):
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_staff  
-class DenyViewPermission(BasePermission):
-    def has_permission(self, request, view):
-        return False
@@ -0,0 +1,111 @@
+"""
+Posting new transactions against an account's balance.
+
+Each post locks the account row before it reads the balance. Concurrent
+posts to one account therefore take turns, and every overdraft check sees
+the balance left by the post before it.
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+
+from .models import InvestmentAccount, Transaction, signed_value
+
+
+class InsufficientFunds(Exception):
+    def __init__(self, balance, amount):
+        self.balance = balance
+        self.amount = amount
+        super().__init__(f'Insufficient funds: the balance is {balance} and this needs {amount}.')
+
+
+def _locked_balance(investment_account_id):
+    accounts = InvestmentAccount.objects.filter(pk=investment_account_id)
+    if not connection.features.has_select_for_update:
+        # SQLite has no row locks. Starting with a no-op write takes the
+        # database write lock now, waiting up to busy_timeout. Otherwise the
+        # read snapshot could go stale and fail at the later write.
+        accounts.update(balance=F('balance'))
+    return accounts.select_for_update().values_list('balance', flat=True).get()
+
+
+def _check_funds(balance, delta):
+    # Only posts that take money out are refused, so an account that is
+    # somehow already overdrawn can still be paid into.
+    if delta < 0 and balance + delta < 0:
+        raise InsufficientFunds(balance, -delta)
+
+
+def _with_retries(post):
+    # Deadlocks, lock timeouts, serialization failures and SQLite's "database
+    # is locked" all surface as OperationalError and roll the transaction
+    # back, so the whole post is retried with jittered backoff. Inside an
+    # outer atomic block the caller's transaction is lost too, so re-raise.
+    config = settings.TRANSACTION_POSTING
+    for attempt in range(config['MAX_ATTEMPTS']):
+        try:
+            with transaction.atomic():
+                return post()
+        except OperationalError:
+            if attempt + 1 == config['MAX_ATTEMPTS'] or transaction.get_connection().in_atomic_block:
+                raise
+            time.sleep(config['RETRY_BACKOFF'] * 2 ** attempt * random.random())
+
+
+def post_transaction(investment_account_id, transaction_type, amount, **fields):
+    def post():
+        _check_funds(_locked_balance(investment_account_id), signed_value(transaction_type, amount))
+        return Transaction.objects.create(
+            investment_account_id=investment_account_id, transaction_type=transaction_type, amount=amount, **fields
+        )
+    return _with_retries(post)
+
+
+def post_transactions(investment_account_id, rows):
+    """
+    Post validated rows as one batch. The batch is refused as a whole if its
+    net effect would overdraw the account.
+    """
+    def post():
+        transactions = [Transaction(investment_account_id=investment_account_id, **row) for row in rows]
+        net = sum((item.signed_amount for item in transactions), Decimal('0'))
+        _check_funds(_locked_balance(investment_account_id), net)
+        return Transaction.objects.bulk_post(investment_account_id, transactions)
+    return _with_retries(post)
+
+
+def update_transaction(investment_account_id, pk, **fields):
+    """
+    Apply validated changes to one of the account's transactions. The
+    change is refused if swapping the old effect for the new one would
+    overdraw the account.
+    """
+    def post():
+        balance = _locked_balance(investment_account_id)
+        # Read under the account lock, so the effect reversed is the stored one.
+        item = Transaction.objects.get(pk=pk, investment_account_id=investment_account_id)
+        before = item.signed_amount
+        for name, value in fields.items():
+            setattr(item, name, value)
+        _check_funds(balance, item.signed_amount - before)
+        item.save()
+        return item
+    return _with_retries(post)
+
+
+def delete_transaction(investment_account_id, pk):
+    """
+    Delete one of the account's transactions, reversing its effect. Deleting
+    a deposit the balance no longer covers is refused.
+    """
+    def post():
+        balance = _locked_balance(investment_account_id)
+        item = Transaction.objects.filter(pk=pk, investment_account_id=investment_account_id).first()
+        if item is not None:
+            _check_funds(balance, -item.signed_amount)
+            item.delete()
+    _with_retries(post)
@@ -0,0 +1,59 @@
+import decimal
+import math
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson installed
+    orjson = None
+
+
+class _Unrepresentable(Exception):
+    pass
+
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # DRF's JSONEncoder decides how every non-native type looks, so the
+    # output matches stdlib rendering. The one thing orjson spells
+    # differently is a float exponent (1e16 vs 1e+16), so such values are
+    # handed back to the stdlib renderer.
+    value = _encoder.default(obj)
+    if isinstance(obj, decimal.Decimal) and (not math.isfinite(value) or 'e' in repr(value)):
+        raise _Unrepresentable(obj)
+    return value
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    Output is byte-for-byte what JSONRenderer produces under the default
+    UNICODE_JSON/COMPACT_JSON settings. Indented output, other settings,
+    values orjson can't encode and a missing orjson all fall back to
+    JSONRenderer. Native floats are emitted as orjson formats them; the
+    project's serializers render amounts as strings.
+    """
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+               | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same \u2028/\u2029 escaping as JSONRenderer.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,169 @@
+"""
+Queued admin reports.
+
+An admin asks for a report on a user and gets a ReportJob row back instead
+of waiting for it. The run_report_worker command claims pending jobs and
+generates them in a process pool. A report is the admin user-transactions
+response with every matching transaction instead of one page, written to
+MEDIA_ROOT as gzipped JSON.
+"""
+import gzip
+import hashlib
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .archive import transaction_history
+from .fast_serializers import ValuesSerializer
+from .models import InvestmentAccount, ReportJob
+from .renderers import ORJSONRenderer
+from .serializers import AdminInvestmentAccountSerializer, AdminTransactionSerializer
+
+
+def dedupe_key(user, start_date, end_date):
+    # Every write to an account stamps its updated_at, so the count and the
+    # latest stamp change whenever the report's contents could.
+    accounts = InvestmentAccount.objects.filter(userinvestmentaccount__user=user).aggregate(
+        count=Count('id'), updated_at=Max('updated_at')
+    )
+    digest = hashlib.sha256()
+    for part in (user.pk, start_date, end_date, accounts['count'], accounts['updated_at']):
+        digest.update(b'' if part is None else str(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def request_report(user, start_date=None, end_date=None, requested_by=None):
+    """
+    The job for this report, queueing one unless an identical request is
+    pending, running or done over unchanged accounts. Returns (job, created).
+    """
+    key = dedupe_key(user, start_date, end_date)
+    existing = ReportJob.objects.exclude(status=ReportJob.FAILED).filter(dedupe_key=key).first()
+    if existing is not None:
+        return existing, False
+    try:
+        with transaction.atomic():
+            job = ReportJob.objects.create(
+                user=user, requested_by=requested_by, start_date=start_date, end_date=end_date, dedupe_key=key
+            )
+        return job, True
+    except IntegrityError:
+        # A concurrent identical request queued it first.
+        return ReportJob.objects.exclude(status=ReportJob.FAILED).get(dedupe_key=key), False
+
+
+def claim_jobs(limit, now=None):
+    """
+    Mark up to `limit` queued jobs as running and return their ids, oldest
+    first. A job left running past STALE_AFTER is queued again.
+    """
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=settings.REPORT_JOBS['STALE_AFTER'])
+    candidates = ReportJob.objects.filter(
+        Q(status=ReportJob.PENDING) | Q(status=ReportJob.RUNNING, started_at__lt=stale)
+    ).order_by('created_at').values_list('pk', 'status', 'started_at')
+
+    claimed = []
+    for pk, status, started_at in candidates[:limit]:
+        # The conditional update is the claim: when workers race for a job,
+        # only the first one's update still matches the row.
+        if ReportJob.objects.filter(pk=pk, status=status, started_at=started_at).update(
+            status=ReportJob.RUNNING, started_at=now
+        ):
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def write_report(out, job):
+    renderer = ORJSONRenderer()
+    chunk_size = settings.REPORT_JOBS['CHUNK_SIZE']
+
+    investment_accounts = InvestmentAccount.objects.filter(userinvestmentaccount__user=job.user_id)
+    account_serializer = ValuesSerializer(AdminInvestmentAccountSerializer)
+    accounts = list(account_serializer.values(investment_accounts.with_total_balance().order_by('id')))
+    header = renderer.render({
+        'user_id': job.user_id,
+        'start_date': job.start_date,
+        'end_date': job.end_date,
+        'generated_at': timezone.now(),
+        'total_balance': sum((account['total_balance'] for account in accounts), Decimal('0')),
+        'accounts': account_serializer.many(accounts),
+    })
+
+    window = Q(investment_account__in=investment_accounts)
+    if job.start_date is not None:
+        window &= Q(timestamp__gte=job.start_date)
+    if job.end_date is not None:
+        window &= Q(timestamp__lte=job.end_date)
+    transaction_serializer = ValuesSerializer(AdminTransactionSerializer)
+    rows = transaction_serializer.values(
+        transaction_history(window, start=job.start_date)
+    ).order_by('timestamp', 'id').iterator(chunk_size=chunk_size)
+
+    # The header object is reopened to append the transactions, which are
+    # rendered a chunk at a time so memory doesn't grow with the user.
+    out.write(header[:-1] + b',"transactions":[')
+    for index, chunk in enumerate(_chunks(rows, chunk_size)):
+        if index:
+            out.write(b',')
+        out.write(renderer.render(transaction_serializer.many(chunk))[1:-1])
+    out.write(b']}')
+
+
+def run_job(job_id):
+    """
+    Generate a claimed job's report and record the outcome. Returns the
+    job's final status.
+    """
+    job = ReportJob.objects.get(pk=job_id)
+    claim = ReportJob.objects.filter(pk=job.pk, status=ReportJob.RUNNING, started_at=job.started_at)
+    try:
+        with tempfile.TemporaryFile() as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+                write_report(out, job)
+            raw.seek(0)
+            job.result.save(f'user-{job.user_id}-report-{job.pk}.json.gz', File(raw), save=False)
+    except Exception as exc:
+        claim.update(status=ReportJob.FAILED, error=f'{type(exc).__name__}: {exc}', finished_at=timezone.now())
+        return ReportJob.FAILED
+
+    if claim.update(status=ReportJob.DONE, result=job.result.name, finished_at=timezone.now()):
+        return ReportJob.DONE
+    # Taken over as stale while this worker was busy; the newer claim wins.
+    job.result.delete(save=False)
+    return ReportJob.RUNNING
+
+
+def fail_job(job_id, error):
+    # For a job whose process died before run_job could record an outcome.
+    return ReportJob.objects.filter(pk=job_id, status=ReportJob.RUNNING).update(
+        status=ReportJob.FAILED, error=f'{type(error).__name__}: {error}', finished_at=timezone.now()
+    )
+
+
+def purge_expired(now=None):
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.REPORT_JOBS['RESULT_TTL'])
+    expired = ReportJob.objects.filter(status__in=[ReportJob.DONE, ReportJob.FAILED], finished_at__lt=cutoff)
+    purged = 0
+    for job in expired.iterator():
+        if job.result:
+            job.result.delete(save=False)
+        job.delete()
+        purged += 1
+    return purged
@@ -1,6 +1,12 @@
 from rest_framework import serializers
+from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import InvestmentAccount, UserInvestmentAccount, Transaction
+from django.db import models
+from .models import InvestmentAccount, UserInvestmentAccount, Transaction, ReportJob
+from .archive import transaction_history
+from .grants import upsert_grants
+from .posting import post_transactions
+from .stats import BUCKETS
 from django_filters import rest_framework as filters
 
 # Serializer for the InvestmentAccount model
@@ -9,6 +15,14 @@ class InvestmentAccountSerializer(serializers.ModelSerializer):
         model = InvestmentAccount
         fields = '__all__'
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # The balance given on create is the opening balance; after that
+        # only transactions move it.
+        if self.instance is not None:
+            fields['balance'].read_only = True
+        return fields
+
 # Serializer for the UserInvestmentAccount model (join table)
 class UserInvestmentAccountSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
@@ -24,6 +38,69 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = '__all__'
 
+class BulkListSerializer(serializers.ListSerializer):
+    def validate_rows(self, rows):
+        # Reuses the single bound child serializer for every row and keeps
+        # going past invalid rows, so callers get every error in one pass.
+        valid, errors = [], []
+        for index, row in enumerate(rows):
+            try:
+                valid.append(self.child.run_validation(row))
+            except serializers.ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+        return valid, errors
+
+class BulkTransactionListSerializer(BulkListSerializer):
+    def create(self, validated_data):
+        return post_transactions(self.context['investment_account_id'], validated_data)
+
+# Serializer for rows posted to the bulk endpoint; the account comes from the URL
+class BulkTransactionSerializer(TransactionSerializer):
+    class Meta(TransactionSerializer.Meta):
+        fields = ['id', 'transaction_type', 'amount', 'timestamp']
+        list_serializer_class = BulkTransactionListSerializer
+
+class BulkGrantListSerializer(BulkListSerializer):
+    def validate_rows(self, rows):
+        valid, errors = super().validate_rows(rows)
+        # Rows naming a missing user or account are errors too, found with
+        # one query per model rather than two per row.
+        user_ids = set(User.objects.filter(pk__in={row['user_id'] for row in valid}).values_list('pk', flat=True))
+        account_ids = set(InvestmentAccount.objects.filter(
+            pk__in={row['investment_account_id'] for row in valid}
+        ).values_list('pk', flat=True))
+
+        failed = {error['index'] for error in errors}
+        indexes = [index for index in range(len(rows)) if index not in failed]
+        found = []
+        for index, row in zip(indexes, valid):
+            missing = {}
+            if row['user_id'] not in user_ids:
+                missing['user'] = [f"Invalid pk \"{row['user_id']}\" - object does not exist."]
+            if row['investment_account_id'] not in account_ids:
+                missing['investment_account'] = [f"Invalid pk \"{row['investment_account_id']}\" - object does not exist."]
+            if missing:
+                errors.append({'index': index, 'errors': missing})
+            else:
+                found.append(row)
+        errors.sort(key=lambda error: error['index'])
+        return found, errors
+
+    def create(self, validated_data):
+        return upsert_grants(validated_data)
+
+# Serializer for rows posted to the bulk grant endpoint; flags default to False
+class BulkGrantSerializer(serializers.Serializer):
+    user = serializers.IntegerField(source='user_id')
+    investment_account = serializers.IntegerField(source='investment_account_id')
+    can_view = serializers.BooleanField(default=False)
+    can_create = serializers.BooleanField(default=False)
+    can_update = serializers.BooleanField(default=False)
+    can_delete = serializers.BooleanField(default=False)
+
+    class Meta:
+        list_serializer_class = BulkGrantListSerializer
+
 # Serializer for the User model (built-in Django user)
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -38,6 +115,34 @@ class TransactionFilter(filters.FilterSet):
         model = Transaction
         fields = ['start_date', 'end_date']
 
+    def as_q(self, prefix=''):
+        # The validated bounds as a Q, for filtering transactions inside
+        # subqueries or reached through a relation (prefix='transaction__').
+        q = models.Q()
+        for name, value in self.form.cleaned_data.items():
+            if value is not None:
+                field = self.filters[name]
+                q &= models.Q(**{f'{prefix}{field.field_name}__{field.lookup_expr}': value})
+        return q
+
+    def history(self, transactions=models.Q()):
+        # Transactions matching both the Q and the validated bounds, reaching
+        # into the archive unless start_date is within the archive horizon.
+        self.is_valid()
+        return transaction_history(transactions & self.as_q(), start=self.form.cleaned_data.get('start_date'))
+
+# Serializer for one row of /me/portfolio/; the activity fields are annotations
+class PortfolioAccountSerializer(serializers.ModelSerializer):
+    transaction_count = serializers.IntegerField(read_only=True)
+    last_activity = serializers.DateTimeField(read_only=True)
+    deposits = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    withdrawals = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = InvestmentAccount
+        fields = ['id', 'account_name', 'account_number', 'balance',
+                  'transaction_count', 'last_activity', 'deposits', 'withdrawals']
+
 class AdminTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
@@ -45,8 +150,57 @@ class AdminTransactionSerializer(serializers.ModelSerializer):
 
 class AdminInvestmentAccountSerializer(serializers.ModelSerializer):
     total_balance = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    transactions = AdminTransactionSerializer(many=True, read_only=True)
 
     class Meta:
         model = InvestmentAccount
-        fields = ['id', 'account_name', 'account_number', 'total_balance', 'transactions']
\ No newline at end of file
+        fields = ['id', 'account_name', 'account_number', 'total_balance']
+
+# Query parameters for the admin balance history endpoint
+class BalanceHistoryQuerySerializer(serializers.Serializer):
+    as_of = serializers.DateField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('start_date') and attrs.get('end_date') and attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError('start_date must not be after end_date.')
+        return attrs
+
+# Query parameters for the transaction stats endpoints; dates go through TransactionFilter
+class TransactionStatsQuerySerializer(serializers.Serializer):
+    bucket = serializers.ChoiceField(choices=BUCKETS, default='month')
+
+# Serializer for one period of transaction stats
+class TransactionBucketSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    deposit_count = serializers.IntegerField()
+    deposit_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    withdrawal_count = serializers.IntegerField()
+    withdrawal_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    net = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class AdminAccountBalanceSerializer(serializers.ModelSerializer):
+    balance_as_of = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    deposits = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    withdrawals = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    net_flow = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = InvestmentAccount
+        fields = ['id', 'account_name', 'account_number', 'balance_as_of', 'deposits', 'withdrawals', 'net_flow']
+
+# Serializer for a queued admin report; download is set once it is done
+class ReportJobSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'user', 'start_date', 'end_date', 'status', 'created_at', 'started_at', 'finished_at', 'error',
+            'download',
+        ]
+
+    def get_download(self, job):
+        if job.status != ReportJob.DONE:
+            return None
+        return self.context['request'].build_absolute_uri(reverse('admin-report-download', args=[job.pk]))
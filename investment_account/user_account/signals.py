@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, grant_cache
+from .models import UserInvestmentAccount
+
+
+@receiver([post_save, post_delete], sender=UserInvestmentAccount)
+def invalidate_grant(sender, instance, **kwargs):
+    # Evict now and again on commit, so a request that reads the old row
+    # before the write commits cannot leave a stale grant behind.
+    grant_cache.invalidate(instance.user_id, instance.investment_account_id)
+    transaction.on_commit(lambda: grant_cache.invalidate(instance.user_id, instance.investment_account_id))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    authentication.evict_user(instance.pk)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        # Straight to the driver so the pragmas don't show up as app queries.
+        connection.connection.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,42 @@
+"""
+Per-period transaction totals, computed in the database.
+
+Transactions are grouped by their timestamp truncated to a day, ISO week or
+month in the current time zone. Each group's deposits and withdrawals are
+counted and summed with conditional aggregation. When the range reaches the
+archive, both tables are grouped in one UNION ALL query. The period that
+straddles the archive horizon then comes back twice and is merged here.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DateField, DecimalField, Q, Sum
+from django.db.models.functions import Trunc
+
+BUCKETS = ('day', 'week', 'month')
+
+TOTALS = ('deposit_count', 'deposit_amount', 'withdrawal_count', 'withdrawal_amount')
+
+
+def bucketed_totals(history, bucket):
+    amount = DecimalField(max_digits=14, decimal_places=2)
+    deposits = Q(transaction_type='deposit')
+    withdrawals = Q(transaction_type='withdrawal')
+    rows = history.annotate(
+        period=Trunc('timestamp', bucket, output_field=DateField())
+    ).values('period').annotate(
+        deposit_count=Count('pk', filter=deposits),
+        deposit_amount=Sum('amount', filter=deposits, default=Decimal('0'), output_field=amount),
+        withdrawal_count=Count('pk', filter=withdrawals),
+        withdrawal_amount=Sum('amount', filter=withdrawals, default=Decimal('0'), output_field=amount),
+    ).order_by('period')
+
+    merged = []
+    for row in rows:
+        if merged and merged[-1]['period'] == row['period']:
+            for name in TOTALS:
+                merged[-1][name] += row[name]
+        else:
+            merged.append(row)
+    for row in merged:
+        row['net'] = row['deposit_amount'] - row['withdrawal_amount']
+    return merged
@@ -1,16 +1,63 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import InvestmentAccount, UserInvestmentAccount, Transaction
-from .serializers import AdminTransactionSerializer, AdminInvestmentAccountSerializer
+from .models import (
+    InvestmentAccount, UserInvestmentAccount, Transaction, DailyAccountBalance, IdempotencyKey, TransactionArchive,
+    ArchivedBalance, ReportJob
+)
+from .serializers import AdminTransactionSerializer, AdminInvestmentAccountSerializer, TransactionFilter, TransactionSerializer
+from .fast_serializers import ValuesSerializer
+from .pagination import after_position
+from .middleware import request_stats
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.exceptions import ParseError
+from .renderers import ORJSONRenderer
+from .parsers import ORJSONParser
 from django.utils import timezone
-from datetime import timedelta
+from django.db import OperationalError, connection, models
+from django.test import override_settings
+from django.conf import settings
+from django.apps import apps as django_apps
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+from django.core.management import CommandError, call_command
+from datetime import datetime, timedelta
+from . import authentication, benchmarks, grant_cache, posting, reports
+from .management.commands import run_report_worker
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from .archive import archive_transactions, transaction_history
+from decimal import Decimal
+from io import BytesIO, StringIO
+from asgiref.sync import async_to_sync
+from investment_account import urls as project_urls
+import asyncio
+import threading
+from unittest import mock
+import time
+import json
+import re
+import gzip
+import os
+import importlib
+import shutil
+import tempfile
 
-class InvestmentAccountAPITestCase(APITestCase):
+class BaseAPITestCase(APITestCase):
 
     def setUp(self):
+        # Rolled-back rows reuse primary keys, so cached grants and users must not outlive a test.
+        grant_cache.clear()
+        authentication.clear_caches()
+
+
+class InvestmentAccountAPITestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
         self.user1 = User.objects.create_user(username='user1', password='password123')
         self.user2 = User.objects.create_user(username='user2', password='password123')
         self.admin_user = User.objects.create_superuser(username='admin', password='password123')
@@ -77,3 +124,1522 @@ class InvestmentAccountAPITestCase(APITestCase):
         response = self.client.get(f'/admin/user-transactions/{self.user1.id}/')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+
+class AdminUserTransactionsBalanceTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='holder', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.admin_token = str(RefreshToken.for_user(self.admin_user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.admin_token}')
+
+    def create_accounts(self, count):
+        for i in range(count):
+            account = InvestmentAccount.objects.create(
+                account_name=f'Account {i}', account_number=f'ACC{InvestmentAccount.objects.count():06d}', balance=0
+            )
+            UserInvestmentAccount.objects.create(user=self.user, investment_account=account, can_view=True)
+            Transaction.objects.create(investment_account=account, transaction_type='deposit', amount=100)
+            Transaction.objects.create(investment_account=account, transaction_type='withdrawal', amount=40)
+
+    def get_user_transactions(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/user-transactions/{self.user.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_total_balance_subtracts_withdrawals(self):
+        self.create_accounts(2)
+        response, _ = self.get_user_transactions()
+
+        self.assertEqual(response.data['total_balance'], Decimal('120'))
+        self.assertEqual([account['total_balance'] for account in response.data['accounts']], ['60.00', '60.00'])
+
+    def test_query_count_does_not_grow_with_accounts(self):
+        self.create_accounts(1)
+        self.get_user_transactions()  # warm the authentication cache
+        _, few_accounts_queries = self.get_user_transactions()
+
+        self.create_accounts(30)
+        _, many_accounts_queries = self.get_user_transactions()
+
+        self.assertEqual(few_accounts_queries, many_accounts_queries)
+
+
+class MaterializedBalanceTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='trader', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Main', account_number='5555555555', balance=1000)
+        UserInvestmentAccount.objects.create(
+            user=self.user, investment_account=self.account,
+            can_view=True, can_create=True, can_update=True, can_delete=True
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def assertBalance(self, expected):
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal(expected))
+
+    def test_balance_follows_transaction_writes(self):
+        response = self.client.post(self.url, data={
+            'investment_account': self.account.id, 'transaction_type': 'deposit', 'amount': '250.00'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertBalance('1250.00')
+
+        response = self.client.put(f"{self.url}{response.data['id']}/", data={
+            'investment_account': self.account.id, 'transaction_type': 'withdrawal', 'amount': '100.00'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertBalance('900.00')
+
+        response = self.client.delete(f"{self.url}{response.data['id']}/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertBalance('1000.00')
+        self.assertEqual(self.account.get_total_balance(), 0)
+
+    def test_account_writes_leave_the_balance_alone(self):
+        stale = InvestmentAccount.objects.get(pk=self.account.pk)
+        Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=50)
+        stale.account_name = 'Renamed'
+        stale.save()
+        self.assertBalance('1050.00')
+
+        response = self.client.patch(f'/investment-accounts/{self.account.id}/', {'balance': '1.00'}, format='json')
+        self.assertEqual((response.status_code, response.data['balance']), (status.HTTP_200_OK, '1050.00'))
+        self.assertBalance('1050.00')
+
+    def test_reconcile_reports_and_corrects_drift(self):
+        Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=300)
+        InvestmentAccount.objects.filter(pk=self.account.pk).update(balance=42)
+
+        out = StringIO()
+        call_command('reconcile_balances', '--dry-run', stdout=out)
+        self.assertIn('expected 1300.00', out.getvalue())
+        self.assertBalance('42.00')
+
+        out = StringIO()
+        call_command('reconcile_balances', stdout=out)
+        self.assertIn('corrected drift on 1', out.getvalue())
+        self.assertBalance('1300.00')
+
+
+class PermissionGrantLookupTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='member', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Shared', account_number='7777777777', balance=0)
+        UserInvestmentAccount.objects.create(
+            user=self.user, investment_account=self.account, can_view=True, can_create=True, can_update=True
+        )
+        self.transaction = Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=10)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def assertSingleGrantLookup(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        grant_queries = [q for q in queries.captured_queries if 'user_account_userinvestmentaccount' in q['sql']]
+        self.assertEqual(len(grant_queries), 1)
+        return response
+
+    def test_list_looks_up_grant_once(self):
+        response = self.assertSingleGrantLookup('get', self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_create_looks_up_grant_once(self):
+        response = self.assertSingleGrantLookup('post', self.url, data={
+            'investment_account': self.account.id, 'transaction_type': 'deposit', 'amount': 5
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_delete_checks_delete_grant(self):
+        response = self.assertSingleGrantLookup('delete', f'{self.url}{self.transaction.id}/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class GrantCacheTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='cached', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Cached', account_number='8888888888', balance=0)
+        self.grant = UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def grant_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [q for q in queries.captured_queries if 'user_account_userinvestmentaccount' in q['sql']]
+
+    def test_repeated_requests_are_served_from_cache(self):
+        before = grant_cache.stats()
+        self.grant_queries()
+        response, queries = self.grant_queries()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+        after = grant_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_revocation_takes_effect_immediately(self):
+        self.assertEqual(self.grant_queries()[0].status_code, status.HTTP_200_OK)
+
+        self.grant.can_view = False
+        self.grant.save()
+        self.assertEqual(self.grant_queries()[0].status_code, status.HTTP_403_FORBIDDEN)
+
+        self.grant.delete()
+        self.assertEqual(self.grant_queries()[0].status_code, status.HTTP_403_FORBIDDEN)
+
+
+class KeysetPaginationTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='pager', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Busy', account_number='9999999999', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        for amount in range(1, 8):
+            Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=amount)
+        # Share a timestamp across rows so the id tie-breaker is exercised.
+        Transaction.objects.filter(amount__lte=4).update(timestamp=timezone.now() - timedelta(days=1))
+        self.expected_ids = list(Transaction.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def collect_pages(self, url, results_key):
+        ids, page_queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'page_size': 3} if '?' not in url else None)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(row['id'] for row in response.data[results_key])
+            page_queries.append([q['sql'] for q in queries.captured_queries if 'user_account_transaction' in q['sql']])
+            url = response.data['next']
+        return ids, page_queries
+
+    def test_transaction_list_pages_in_timestamp_order(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        ids, page_queries = self.collect_pages(self.url, 'results')
+
+        self.assertEqual(ids, self.expected_ids)
+        self.assertEqual(len(page_queries), 3)
+        for queries in page_queries:
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('OFFSET', queries[0])
+
+    def test_admin_transactions_are_paginated(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin_user).access_token}')
+        ids, _ = self.collect_pages(f'/admin/user-transactions/{self.user.id}/', 'transactions')
+
+        self.assertEqual(ids, self.expected_ids)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class IndexUsageTestCase(TestCase):
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, f'USING (COVERING )?INDEX {index_name}')
+
+    def test_account_date_range_uses_composite_index(self):
+        queryset = TransactionFilter(
+            {'start_date': '2024-01-01T00:00:00Z', 'end_date': '2024-12-31T00:00:00Z'},
+            queryset=Transaction.objects.filter(investment_account_id=1)
+        ).qs
+        self.assertUsesIndex(queryset, 'txn_account_activity_idx')
+
+    def test_keyset_page_uses_composite_index(self):
+        queryset = after_position(Transaction.objects.filter(investment_account_id=1), (timezone.now(), 10))
+        self.assertUsesIndex(queryset.order_by('timestamp', 'id')[:100], 'txn_account_activity_idx')
+
+    def test_keyset_page_needs_no_sort(self):
+        queryset = after_position(Transaction.objects.filter(investment_account_id=1), (timezone.now(), 10))
+        self.assertNotIn('TEMP B-TREE', queryset.order_by('timestamp', 'id')[:100].explain())
+
+    def test_account_activity_reads_only_the_index(self):
+        plan = InvestmentAccount.objects.viewable_by(1).with_activity().explain()
+        self.assertIn('USING COVERING INDEX txn_account_activity_idx', plan)
+        self.assertNotIn('FOR GROUP BY', plan)
+
+    def test_viewable_accounts_use_partial_index(self):
+        queryset = UserInvestmentAccount.objects.filter(user_id=1, can_view=True).values('investment_account_id')
+        self.assertUsesIndex(queryset, 'uia_viewable_idx')
+
+    def test_grant_lookup_uses_unique_index(self):
+        queryset = UserInvestmentAccount.objects.filter(user_id=1, investment_account_id=1)
+        self.assertIn('(user_id=? AND investment_account_id=?)', queryset.explain())
+
+
+class AdminTransactionExportTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='exporter', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Export', account_number='1212121212', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        self.old = Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=100)
+        self.recent = Transaction.objects.create(investment_account=self.account, transaction_type='withdrawal', amount='25.50')
+        Transaction.objects.filter(pk=self.old.pk).update(timestamp=timezone.now() - timedelta(days=30))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin_user).access_token}')
+        self.url = f'/admin/user-transactions/{self.user.id}/export/'
+
+    def export(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_honors_date_range(self):
+        content = self.export({'start_date': (timezone.now() - timedelta(days=7)).isoformat()})
+        lines = content.splitlines()
+
+        self.assertEqual(lines[0], 'id,investment_account,transaction_type,amount,timestamp')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{self.recent.id},{self.account.id},withdrawal,25.50,'))
+
+    def test_ndjson_export_matches_admin_serializer(self):
+        content = self.export({'output': 'ndjson'})
+        rows = [json.loads(line) for line in content.splitlines()]
+
+        self.old.refresh_from_db()
+        self.recent.refresh_from_db()
+        expected = AdminTransactionSerializer([self.old, self.recent], many=True).data
+        self.assertEqual(rows, [dict(row) for row in expected])
+
+    def test_unknown_output_is_rejected(self):
+        response = self.client.get(self.url, {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkTransactionTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='importer', password='password123')
+        self.viewer = User.objects.create_user(username='viewer', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Import', account_number='3434343434', balance=100)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_create=True)
+        UserInvestmentAccount.objects.create(user=self.viewer, investment_account=self.account, can_view=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = f'/investment-accounts/{self.account.id}/transactions/bulk/'
+
+    def rows(self, count):
+        return [{'transaction_type': 'deposit', 'amount': '10.00'} for _ in range(count)]
+
+    def assertBalance(self, expected):
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal(expected))
+
+    def test_json_array_reports_per_row_errors(self):
+        rows = self.rows(2) + [{'transaction_type': 'transfer', 'amount': '1.00'}, {'transaction_type': 'withdrawal', 'amount': '5.00'}]
+        response = self.client.post(self.url, rows, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [2])
+        self.assertIn('transaction_type', response.data['errors'][0]['errors'])
+        self.assertBalance('115.00')
+
+    def test_all_or_nothing_mode_writes_nothing_on_error(self):
+        rows = self.rows(3) + [{'transaction_type': 'deposit'}]
+        response = self.client.post(f'{self.url}?atomic=true', rows, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(Transaction.objects.filter(investment_account=self.account).count(), 0)
+        self.assertBalance('100.00')
+
+    def test_ndjson_body(self):
+        body = '\n'.join(json.dumps(row) for row in self.rows(4)) + '\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 4)
+        self.assertBalance('140.00')
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.client.post(self.url, self.rows(1), format='json')
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(self.url, self.rows(5), format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(self.url, self.rows(200), format='json')
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Transaction.objects.filter(investment_account=self.account).count(), 206)
+
+    def test_requires_create_permission(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.viewer).access_token}')
+        response = self.client.post(self.url, self.rows(1), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class DailyBalanceRollupTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='saver', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Savings', account_number='5656565656', balance=1000)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        self.today = timezone.localdate()
+
+    def rollup(self):
+        return list(
+            DailyAccountBalance.objects.filter(investment_account=self.account)
+            .exclude(deposits=0, withdrawals=0)
+            .order_by('day')
+            .values_list('day', 'deposits', 'withdrawals', 'closing_balance')
+        )
+
+    def create_on(self, days_ago, transaction_type, amount):
+        item = Transaction.objects.create(investment_account=self.account, transaction_type=transaction_type, amount=amount)
+        item.timestamp = timezone.now() - timedelta(days=days_ago)
+        item.save()
+        return item
+
+    def test_writes_maintain_rollup_incrementally(self):
+        self.create_on(3, 'deposit', 200)
+        self.create_on(1, 'withdrawal', 50)
+        backdated = self.create_on(2, 'deposit', 30)
+        Transaction.objects.bulk_post(self.account.id, [
+            Transaction(investment_account=self.account, transaction_type='deposit', amount=5),
+        ])
+        backdated.delete()
+
+        incremental = self.rollup()
+        call_command('rebuild_daily_balances', stdout=StringIO())
+        self.assertEqual(incremental, self.rollup())
+        self.assertEqual(incremental, [
+            (self.today - timedelta(days=3), Decimal('200.00'), Decimal('0.00'), Decimal('200.00')),
+            (self.today - timedelta(days=1), Decimal('0.00'), Decimal('50.00'), Decimal('150.00')),
+            (self.today, Decimal('5.00'), Decimal('0.00'), Decimal('155.00')),
+        ])
+
+    def test_migration_backfills_existing_transactions(self):
+        self.create_on(3, 'deposit', 200)
+        self.create_on(1, 'withdrawal', 50)
+        call_command('rebuild_daily_balances', stdout=StringIO())
+        rebuilt = self.rollup()
+        DailyAccountBalance.objects.all().delete()
+
+        backfill = importlib.import_module('user_account.migrations.0010_backfill_daily_balances')
+        backfill.backfill_daily_balances(django_apps, None)
+        self.assertEqual(self.rollup(), rebuilt)
+
+    def test_admin_balance_history_reads_rollup(self):
+        self.create_on(10, 'deposit', 500)
+        self.create_on(5, 'withdrawal', 100)
+        self.create_on(1, 'deposit', 40)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin_user).access_token}')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/user-transactions/{self.user.id}/balances/', {
+                'as_of': (self.today - timedelta(days=3)).isoformat(),
+                'start_date': (self.today - timedelta(days=7)).isoformat(),
+            })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('user_account_transaction' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(response.data['total_balance_as_of'], Decimal('1400.00'))
+        self.assertEqual(response.data['net_flow'], Decimal('-100.00'))
+        account = response.data['accounts'][0]
+        self.assertEqual((account['deposits'], account['withdrawals']), ('0.00', '100.00'))
+
+    def test_invalid_range_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin_user).access_token}')
+        response = self.client.get(f'/admin/user-transactions/{self.user.id}/balances/', {
+            'start_date': self.today.isoformat(), 'end_date': (self.today - timedelta(days=1)).isoformat()
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RequestMetricsTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        request_stats.reset()
+        self.user = User.objects.create_user(username='measured', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Measured', account_number='7878787878', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def test_server_timing_header_and_stats(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        response = self.client.get(self.url)
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin_user).access_token}')
+        response = self.client.get('/admin/request-stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        endpoint = next(row for row in response.data['endpoints'] if row['view'] == 'transactions-list')
+        self.assertEqual((endpoint['action'], endpoint['requests']), ('list', 1))
+        self.assertGreater(endpoint['avg_queries'], 0)
+        self.assertIn('hits', response.data['grant_cache'])
+
+    def test_serializer_time_is_reported_separately(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        many = ValuesSerializer.many
+
+        def slow_many(serializer, rows):
+            time.sleep(0.02)
+            return many(serializer, rows)
+
+        with mock.patch.object(ValuesSerializer, 'many', slow_many):
+            response = self.client.get(self.url)
+        serialize_ms = float(re.search(r'serialize;dur=([\d.]+)', response['Server-Timing']).group(1))
+        self.assertGreaterEqual(serialize_ms, 20)
+        self.assertGreaterEqual(request_stats.snapshot()[0]['avg_serialize_ms'], 20)
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        response = self.client.get('/admin/request-stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(REQUEST_METRICS={'SAMPLE_RATE': 1.0, 'SLOW_REQUEST_MS': 0})
+    def test_slow_requests_are_logged(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with self.assertLogs('user_account.middleware', level='WARNING') as logs:
+            self.client.get(self.url)
+        self.assertIn(f'GET {self.url}', logs.output[0])
+
+    @override_settings(REQUEST_METRICS={'SAMPLE_RATE': 0.0, 'SLOW_REQUEST_MS': 500})
+    def test_unsampled_requests_are_not_measured(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        response = self.client.get(self.url)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(request_stats.snapshot(), [])
+
+
+class SeedDataAndBenchmarkTestCase(BaseAPITestCase):
+
+    def test_seed_data_builds_consistent_dataset(self):
+        call_command(
+            'seed_data', users=4, accounts=6, grant_density=0.5, transactions_per_account=20, seed=7, stdout=StringIO()
+        )
+
+        self.assertEqual(User.objects.filter(username__startswith='seed-user-').count(), 4)
+        self.assertEqual(UserInvestmentAccount.objects.count(), 12)
+        self.assertEqual(Transaction.objects.count(), 120)
+        out = StringIO()
+        call_command('reconcile_balances', '--dry-run', stdout=out)
+        self.assertIn('found drift on 0', out.getvalue())
+
+    def test_api_scenarios_report_latency_and_queries(self):
+        call_command(
+            'seed_data', users=2, accounts=2, grant_density=1, transactions_per_account=5, seed=7, stdout=StringIO()
+        )
+        results = benchmarks.run_api(['transaction_list', 'admin_user_transactions'], iterations=3)
+
+        for result in results.values():
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries_per_request'], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'transaction_list': {'p95_ms': 10.0, 'rps': 100.0, 'queries_per_request': 2.0}}
+        current = {'transaction_list': {'p95_ms': 13.0, 'rps': 95.0, 'queries_per_request': 3.0}}
+
+        regressions = benchmarks.compare(current, baseline, tolerance=0.2)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('transaction_list: p95'))
+
+
+
+class CachedJWTAuthenticationTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='frequent', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Hot', account_number='9090909090', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [q['sql'] for q in queries.captured_queries]
+
+    def test_cached_user_and_grants_skip_queries(self):
+        self.get()
+        response, queries = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('auth_user' in sql or 'user_account_userinvestmentaccount' in sql for sql in queries))
+        # The account's ETag validator, then the page itself.
+        self.assertEqual(len(queries), 2)
+
+    def test_deactivation_is_honoured(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.get()[0].status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_unsignalled_changes_are_honoured_after_ttl(self):
+        self.get()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get()[0].status_code, status.HTTP_200_OK)
+
+        # Let the cached entry reach the end of its TTL.
+        cached = authentication.user_cache.get(self.user.pk)
+        authentication.user_cache.set(self.user.pk, cached, time.time() - 1)
+        self.assertEqual(self.get()[0].status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tampered_token_is_rejected(self):
+        self.get()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}x')
+
+        self.assertEqual(self.get()[0].status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_lru_cache_is_bounded(self):
+        cache = authentication.LRUCache(2)
+        expires_at = time.time() + 60
+        cache.set('a', 1, expires_at)
+        cache.set('b', 2, expires_at)
+        cache.get('a')
+        cache.set('c', 3, expires_at)
+
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        cache.set('d', 4, time.time() - 1)
+        self.assertIsNone(cache.get('d'))
+
+
+class ListQueryCountTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin_user).access_token}')
+
+    def add_members(self, count):
+        for _ in range(count):
+            n = InvestmentAccount.objects.count()
+            user = User.objects.create_user(username=f'member{n}', password='password123')
+            account = InvestmentAccount.objects.create(account_name=f'Account {n}', account_number=f'LQ{n:08d}', balance=0)
+            UserInvestmentAccount.objects.create(user=user, investment_account=account, can_view=True)
+            UserInvestmentAccount.objects.create(user=self.admin_user, investment_account=account, can_view=True)
+            Transaction.objects.create(investment_account=account, transaction_type='deposit', amount=5)
+
+    def assertConstantQueries(self, url):
+        self.add_members(1)
+        self.client.get(url)  # warm the authentication cache
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.add_members(15)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few), len(many))
+        return len(many)
+
+    def test_user_investment_account_list(self):
+        self.assertEqual(self.assertConstantQueries('/user-investment-accounts/'), 1)
+
+    def test_investment_account_list(self):
+        self.assertEqual(self.assertConstantQueries('/investment-accounts/'), 1)
+
+    def test_admin_user_transactions(self):
+        self.assertConstantQueries(f'/admin/user-transactions/{self.admin_user.id}/')
+
+
+class ValuesSerializerTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reader', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Fast', account_number='7070707070', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        for amount in ['0.01', '12.50', '9999999999.99', '100']:
+            Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=amount)
+        Transaction.objects.create(investment_account=self.account, transaction_type='withdrawal', amount='3.335')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def assertSameJSON(self, serializer_class, queryset):
+        fast = ValuesSerializer(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        self.assertEqual(JSONRenderer().render(fast.many(fast.values(queryset))), expected)
+
+    def test_matches_model_serializers(self):
+        queryset = Transaction.objects.order_by('id')
+        self.assertSameJSON(TransactionSerializer, queryset)
+        self.assertSameJSON(AdminTransactionSerializer, queryset)
+
+    def test_list_and_retrieve_match_model_serializer(self):
+        url = f'/investment-accounts/{self.account.id}/transactions/'
+        transactions = Transaction.objects.order_by('timestamp', 'id')
+
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content)['results'], json.loads(JSONRenderer().render(
+            TransactionSerializer(transactions, many=True).data
+        )))
+
+        first = transactions[0]
+        response = self.client.get(f'{url}{first.id}/')
+        self.assertEqual(response.content, JSONRenderer().render(TransactionSerializer(first).data))
+        self.assertEqual(self.client.get(f'{url}999999/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_serializer_microbenchmark_checks_output(self):
+        results = benchmarks.run_serializers([200], repeat=1)
+        self.assertEqual(results['serialize_200']['rows'], 200)
+
+
+class ORJSONRendererTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = {
+            'total_balance': Decimal('1234.50'),
+            'tiny': Decimal('0.00001'),
+            'huge': Decimal('1E+20'),
+            'when': timezone.now(),
+            'day': timezone.now().date(),
+            'text': 'café     "quoted" \x01',
+            'nested': [{1: None, 'ok': True}, (1, 2.5)],
+        }
+
+    def test_output_matches_json_renderer(self):
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_indent_matches_json_renderer(self):
+        media_type = 'application/json; indent=2'
+        self.assertEqual(ORJSONRenderer().render(self.data, media_type), JSONRenderer().render(self.data, media_type))
+
+    def test_falls_back_without_orjson(self):
+        with mock.patch('user_account.renderers.orjson', None), mock.patch('user_account.parsers.orjson', None):
+            self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+            self.assertEqual(ORJSONParser().parse(BytesIO(b'{"a": [1, 2]}')), {'a': [1, 2]})
+
+    def test_parser_matches_json_parser(self):
+        body = b'{"amount": "10.00", "n": 123456789012345678901234567890, "f": 1.5}'
+        self.assertEqual(ORJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"a": NaN}'))
+
+    def test_api_responses_use_orjson_renderer(self):
+        admin = User.objects.create_superuser(username='admin', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+        response = self.client.get(f'/admin/user-transactions/{admin.id}/')
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_renderer_benchmark_checks_output(self):
+        call_command(
+            'seed_data', users=2, accounts=2, grant_density=1, transactions_per_account=5, seed=7, stdout=StringIO()
+        )
+        result = benchmarks.run_renderers(iterations=2)['admin_user_transactions']
+        self.assertEqual(result['rows'], 10)
+
+
+class AsyncReadURLConf:
+    urlpatterns = project_urls.async_read_urlpatterns + project_urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncReadURLConf)
+class AsyncReadViewTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='async-reader', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Async', account_number='6060606060', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True, can_create=True)
+        for amount in ['10.00', '2.50', '7.25']:
+            Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=amount)
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def headers(self, user):
+        return {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    def async_request(self, method, *args, **kwargs):
+        async def request():
+            return await getattr(self.async_client, method)(*args, **kwargs)
+        return async_to_sync(request)()
+
+    def assertSameAsSync(self, url, user):
+        expected = self.client.get(url, headers=self.headers(user))
+        response = self.async_request('get', url, headers=self.headers(user))
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_read_views_are_async(self):
+        for view in AsyncReadURLConf.urlpatterns[:3]:
+            self.assertTrue(asyncio.iscoroutinefunction(view.callback))
+
+    def test_list_and_retrieve_match_sync_views(self):
+        self.assertSameAsSync(f'{self.url}?page_size=2', self.user)
+        transaction = Transaction.objects.first()
+        self.assertSameAsSync(f'{self.url}{transaction.id}/', self.user)
+        self.assertSameAsSync(f'{self.url}999999/', self.user)
+
+    def test_admin_view_matches_sync_view(self):
+        UserInvestmentAccount.objects.create(user=self.admin_user, investment_account=self.account, can_view=True)
+        response = self.assertSameAsSync(f'/admin/user-transactions/{self.user.id}/', self.admin_user)
+        self.assertEqual(response.json()['total_balance'], 19.75)
+        self.assertIn('Server-Timing', response)
+        self.assertSameAsSync('/admin/user-transactions/999999/', self.admin_user)
+
+    def test_permissions_are_enforced(self):
+        outsider = User.objects.create_user(username='outsider', password='password123')
+        response = self.async_request('get', self.url, headers=self.headers(outsider))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.async_request('get', self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_writes_go_to_sync_views(self):
+        response = self.async_request(
+            'post', self.url, {'investment_account': self.account.id, 'transaction_type': 'deposit', 'amount': '5.00'},
+            content_type='application/json', headers=self.headers(self.user),
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transaction.objects.count(), 4)
+
+
+class TransactionPostingTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='spender', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Tight', account_number='5151515151', balance=100)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True, can_create=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+
+    def post(self, transaction_type, amount):
+        return self.client.post(self.url, {
+            'investment_account': self.account.id, 'transaction_type': transaction_type, 'amount': amount
+        }, format='json')
+
+    def test_overdrawing_withdrawal_is_refused(self):
+        self.assertEqual(self.post('withdrawal', '60.00').status_code, status.HTTP_201_CREATED)
+        response = self.post('withdrawal', '40.01')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Insufficient funds', response.data['amount'][0])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('40.00'))
+        self.assertEqual(self.post('withdrawal', '40.00').status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_batch_is_refused_when_net_overdraws(self):
+        rows = [{'transaction_type': 'deposit', 'amount': '10.00'}, {'transaction_type': 'withdrawal', 'amount': '120.00'}]
+        response = self.client.post(f'{self.url}bulk/', rows, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], 0)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_edits_and_deletes_that_overdraw_are_refused(self):
+        UserInvestmentAccount.objects.filter(user=self.user).update(can_update=True, can_delete=True)
+        deposit = self.post('deposit', '50.00').data['id']
+        withdrawal = self.post('withdrawal', '120.00').data['id']
+
+        turned = self.client.patch(f'{self.url}{deposit}/', {'transaction_type': 'withdrawal'}, format='json')
+        self.assertEqual(turned.status_code, status.HTTP_400_BAD_REQUEST)
+        raised = self.client.patch(f'{self.url}{withdrawal}/', {'amount': '150.01'}, format='json')
+        self.assertEqual(raised.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.delete(f'{self.url}{deposit}/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('30.00'))
+
+        self.assertEqual(self.client.patch(f'{self.url}{withdrawal}/', {'amount': '150.00'}, format='json').status_code, 200)
+        self.assertEqual(self.client.delete(f'{self.url}{withdrawal}/').status_code, status.HTTP_204_NO_CONTENT)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('150.00'))
+
+
+@override_settings(TRANSACTION_POSTING={'MAX_ATTEMPTS': 100, 'RETRY_BACKOFF': 0.002})
+class ConcurrentPostingTestCase(TransactionTestCase):
+    threads = 8
+    withdrawals_per_thread = 25
+
+    def test_parallel_withdrawals_never_overdraw(self):
+        account = InvestmentAccount.objects.create(account_name='Contended', account_number='5050505050', balance=150)
+        outcomes, errors, lock = [], [], threading.Lock()
+
+        def withdraw():
+            try:
+                for _ in range(self.withdrawals_per_thread):
+                    try:
+                        posting.post_transaction(account.id, 'withdrawal', Decimal('1.00'))
+                        outcome = 'posted'
+                    except posting.InsufficientFunds:
+                        outcome = 'refused'
+                    with lock:
+                        outcomes.append(outcome)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=withdraw) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes.count('posted'), 150)
+        self.assertEqual(outcomes.count('refused'), self.threads * self.withdrawals_per_thread - 150)
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal('0.00'))
+        self.assertEqual(Transaction.objects.filter(investment_account=account).count(), 150)
+        self.assertEqual(
+            DailyAccountBalance.objects.get(investment_account=account).closing_balance, Decimal('-150.00')
+        )
+
+    def test_lock_errors_are_retried(self):
+        account = InvestmentAccount.objects.create(account_name='Busy', account_number='5252525252', balance=10)
+        calls = []
+        original = posting._locked_balance
+
+        def flaky(investment_account_id):
+            calls.append(investment_account_id)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return original(investment_account_id)
+
+        with mock.patch.object(posting, '_locked_balance', flaky):
+            posting.post_transaction(account.id, 'withdrawal', Decimal('5.00'))
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Transaction.objects.filter(investment_account=account).count(), 1)
+
+
+class IdempotencyKeyTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='retrier', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Retry', account_number='4040404040', balance=100)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True, can_create=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = f'/investment-accounts/{self.account.id}/transactions/'
+        self.body = {'investment_account': self.account.id, 'transaction_type': 'deposit', 'amount': '25.00'}
+
+    def post(self, body, key, url=None):
+        return self.client.post(url or self.url, body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response_with_one_query(self):
+        first = self.post(self.body, 'abc-1')
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post(self.body, 'abc-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('user_account_idempotencykey', queries.captured_queries[0]['sql'])
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('125.00'))
+
+    def test_key_reused_for_different_request_is_rejected(self):
+        self.post(self.body, 'abc-2')
+        response = self.post({**self.body, 'amount': '30.00'}, 'abc-2')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_failed_request_releases_key(self):
+        self.assertEqual(self.post({**self.body, 'amount': 'oops'}, 'abc-3').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post(self.body, 'abc-3').status_code, status.HTTP_201_CREATED)
+
+    def test_in_flight_key_conflicts(self):
+        IdempotencyKey.objects.create(user=self.user, key='abc-4', fingerprint='pending')
+        self.assertEqual(self.post(self.body, 'abc-4').status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_bulk_retry_is_replayed(self):
+        rows = [{'transaction_type': 'deposit', 'amount': '1.00'}, {'transaction_type': 'deposit', 'amount': '2.00'}]
+        first = self.post(rows, 'bulk-1', url=f'{self.url}bulk/')
+        retry = self.post(rows, 'bulk-1', url=f'{self.url}bulk/')
+
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_expired_keys_are_ignored_and_purged(self):
+        self.post(self.body, 'abc-5')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertNotIn('Idempotent-Replayed', self.post(self.body, 'abc-5'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Purged 1 idempotency keys.', out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class DatabaseSettingsTestCase(TransactionTestCase):
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        fresh = connection.copy()
+        try:
+            fresh.ensure_connection()
+            busy_timeout = fresh.connection.execute('PRAGMA busy_timeout').fetchone()[0]
+            self.assertEqual(busy_timeout, settings.SQLITE_PRAGMAS['busy_timeout'])
+        finally:
+            fresh.close()
+
+    def test_wal_is_opt_in(self):
+        # journal_mode persists in the database file, so it is never set unasked.
+        self.assertNotIn('journal_mode', settings.SQLITE_PRAGMAS)
+
+    def test_database_benchmark_runs_both_profiles(self):
+        account = InvestmentAccount.objects.create(account_name='Bench', account_number='3030303030', balance=0)
+        Transaction.objects.create(investment_account=account, transaction_type='deposit', amount=1)
+
+        with override_settings(TRANSACTION_POSTING={'MAX_ATTEMPTS': 100, 'RETRY_BACKOFF': 0.002}):
+            results = benchmarks.run_database(readers=2, writers=2, operations=5)
+
+        self.assertEqual(set(results), {'before', 'after'})
+        self.assertGreater(min(result['writes_per_s'] for result in results.values()), 0)
+        self.assertLessEqual(Transaction.objects.count(), 1 + 2 * 2 * 5)
+
+
+class PortfolioTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='investor', password='password123')
+        self.accounts = [
+            InvestmentAccount.objects.create(account_name=f'Folio {n}', account_number=f'20202020{n:02d}', balance=100)
+            for n in range(3)
+        ]
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.accounts[0], can_view=True)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.accounts[1], can_view=True)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.accounts[2], can_create=True)
+        self.old = Transaction.objects.create(investment_account=self.accounts[0], transaction_type='deposit', amount=50)
+        Transaction.objects.filter(pk=self.old.pk).update(timestamp=timezone.now() - timedelta(days=10))
+        self.recent = Transaction.objects.create(investment_account=self.accounts[0], transaction_type='withdrawal', amount=20)
+        Transaction.objects.create(investment_account=self.accounts[2], transaction_type='deposit', amount=5)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_summarizes_viewable_accounts_in_one_query(self):
+        self.client.get('/me/portfolio/')  # warm the authentication cache
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/me/portfolio/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['balance'], Decimal('230.00'))
+        first, second = response.data['accounts']
+        self.assertEqual([first['id'], second['id']], [self.accounts[0].id, self.accounts[1].id])
+        self.assertEqual(
+            (first['transaction_count'], first['deposits'], first['withdrawals']), (2, '50.00', '20.00')
+        )
+        self.assertEqual(first['last_activity'], TransactionSerializer(self.recent).data['timestamp'])
+        self.assertEqual((second['transaction_count'], second['last_activity'], second['deposits']), (0, None, '0.00'))
+
+    def test_date_window_narrows_activity(self):
+        start = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.get('/me/portfolio/', {'start_date': start})
+
+        first = response.data['accounts'][0]
+        self.assertEqual((first['transaction_count'], first['deposits'], first['withdrawals']), (1, '0.00', '20.00'))
+        self.assertEqual(self.client.get('/me/portfolio/', {'end_date': 'soon'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/me/portfolio/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ConditionalRequestTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='poller', password='password123')
+        self.stranger = User.objects.create_user(username='stranger', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Polled', account_number='3030303030', balance=100)
+        UserInvestmentAccount.objects.create(
+            user=self.user, investment_account=self.account, can_view=True, can_create=True, can_update=True, can_delete=True
+        )
+        self.transaction = Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=10)
+        self.account_url = f'/investment-accounts/{self.account.id}/'
+        self.list_url = f'/investment-accounts/{self.account.id}/transactions/'
+        self.authenticate(self.user)
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def backdate(self):
+        InvestmentAccount.objects.filter(pk=self.account.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def test_unchanged_account_is_not_modified_after_one_query(self):
+        etag = self.client.get(self.account_url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.account_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 1)
+
+    def test_account_update_changes_etag(self):
+        etag = self.client.get(self.account_url)['ETag']
+        self.client.patch(self.account_url, {'account_name': 'Renamed'}, format='json')
+
+        response = self.client.get(self.account_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['account_name'], 'Renamed')
+
+    def test_transaction_writes_change_list_etag(self):
+        etag = self.client.get(self.list_url)['ETag']
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post(self.list_url, {
+            'investment_account': self.account.id, 'transaction_type': 'withdrawal', 'amount': '5.00'
+        }, format='json')
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(response.data['results'])), (status.HTTP_200_OK, 2))
+
+        etag = response['ETag']
+        self.client.delete(f'{self.list_url}{self.transaction.id}/')
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_reconciled_balance_changes_etag(self):
+        InvestmentAccount.objects.filter(pk=self.account.pk).update(balance=5)
+        self.backdate()
+        response = self.client.get(self.account_url)
+        self.assertEqual(response.data['balance'], '5.00')
+
+        call_command('reconcile_balances', stdout=StringIO())
+        response = self.client.get(
+            self.account_url, HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual((response.status_code, response.data['balance']), (status.HTTP_200_OK, '110.00'))
+
+    def test_pages_have_their_own_etags(self):
+        first = self.client.get(self.list_url)['ETag']
+        self.assertNotEqual(self.client.get(self.list_url, {'page_size': 1})['ETag'], first)
+
+    def test_last_modified_is_sent_once_the_second_has_passed(self):
+        # Pin the clock to the second of the last write.
+        now = timezone.now()
+        InvestmentAccount.objects.filter(pk=self.account.pk).update(updated_at=now)
+        with mock.patch('django.utils.timezone.now', return_value=now.replace(microsecond=999999)):
+            self.assertNotIn('Last-Modified', self.client.get(self.account_url))
+
+        self.backdate()
+        last_modified = self.client.get(self.list_url)['Last-Modified']
+        response = self.client.get(self.list_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_permissions_are_checked_before_validators(self):
+        etag = self.client.get(self.account_url)['ETag']
+        self.authenticate(self.stranger)
+        self.assertEqual(
+            self.client.get(self.account_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_403_FORBIDDEN
+        )
+
+    def test_async_list_honours_etag(self):
+        with override_settings(ROOT_URLCONF=AsyncReadURLConf):
+            etag = self.client.get(self.list_url)['ETag']
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class TransactionArchiveTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='saver', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Old', account_number='4040404040', balance=100)
+        UserInvestmentAccount.objects.create(
+            user=self.user, investment_account=self.account, can_view=True, can_update=True, can_delete=True
+        )
+        self.old = [
+            Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=50),
+            Transaction.objects.create(investment_account=self.account, transaction_type='withdrawal', amount=20),
+        ]
+        self.recent = Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=5)
+        for days, item in ((1100, self.old[0]), (1000, self.old[1])):
+            Transaction.objects.filter(pk=item.pk).update(timestamp=timezone.now() - timedelta(days=days))
+        call_command('rebuild_daily_balances', stdout=StringIO())
+        self.list_url = f'/investment-accounts/{self.account.id}/transactions/'
+        self.authenticate(self.user)
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_transactions', *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_old_transactions_and_carries_their_totals(self):
+        rollup = list(DailyAccountBalance.objects.order_by('day').values_list('day', 'closing_balance'))
+        self.assertIn('Archived 2 transactions from 1 accounts.', self.archive())
+
+        self.assertEqual(list(Transaction.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(
+            sorted(TransactionArchive.objects.values_list('pk', flat=True)), [item.pk for item in self.old]
+        )
+        carried = ArchivedBalance.objects.get(investment_account=self.account)
+        self.assertEqual(
+            (carried.transaction_count, carried.deposits, carried.withdrawals, carried.net),
+            (2, Decimal('50'), Decimal('20'), Decimal('30')),
+        )
+        self.assertEqual(carried.last_activity, TransactionArchive.objects.get(pk=self.old[1].pk).timestamp)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('135.00'))
+
+        out = StringIO()
+        call_command('reconcile_balances', '--dry-run', stdout=out)
+        self.assertIn('found drift on 0', out.getvalue())
+        call_command('rebuild_daily_balances', stdout=StringIO())
+        self.assertEqual(list(DailyAccountBalance.objects.order_by('day').values_list('day', 'closing_balance')), rollup)
+
+    def test_refuses_to_archive_within_the_horizon(self):
+        with self.assertRaises(CommandError):
+            self.archive('--before', timezone.localdate().isoformat())
+
+    def test_listing_and_retrieval_cover_the_archive(self):
+        before = self.client.get(self.list_url).data
+        self.archive()
+        self.assertEqual(self.client.get(self.list_url).data, before)
+        self.assertEqual(len(before['results']), 3)
+
+        archived_url = f'{self.list_url}{self.old[0].id}/'
+        self.assertEqual(self.client.get(archived_url).data['amount'], '50.00')
+        self.assertEqual(self.client.delete(archived_url).status_code, status.HTTP_404_NOT_FOUND)
+
+        with override_settings(ROOT_URLCONF=AsyncReadURLConf):
+            self.assertEqual(self.client.get(self.list_url).data, before)
+            self.assertEqual(self.client.get(archived_url).data['amount'], '50.00')
+
+    def test_pages_continue_across_the_archive(self):
+        self.archive()
+        first = self.client.get(self.list_url, {'page_size': 2}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual(
+            [row['id'] for row in first['results'] + second['results']],
+            [self.old[0].id, self.old[1].id, self.recent.id],
+        )
+
+    def test_archive_is_skipped_when_the_range_starts_within_the_horizon(self):
+        self.archive()
+        self.authenticate(self.admin_user)
+        url = f'/admin/user-transactions/{self.user.id}/'
+
+        with CaptureQueriesContext(connection) as queries:
+            recent = self.client.get(url, {'start_date': (timezone.now() - timedelta(days=1)).isoformat()})
+        self.assertFalse(any('transactionarchive' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual([row['id'] for row in recent.data['transactions']], [self.recent.id])
+
+        everything = self.client.get(url)
+        self.assertEqual(len(everything.data['transactions']), 3)
+        self.assertEqual(everything.data['total_balance'], Decimal('35.00'))
+
+        export = self.client.get(f'{url}export/', {'output': 'ndjson'})
+        self.assertEqual(len(b''.join(export.streaming_content).splitlines()), 3)
+
+    def test_cursor_past_the_horizon_skips_the_archive(self):
+        history = transaction_history(models.Q(investment_account=self.account))
+        self.assertIsNotNone(history.archived)
+        self.assertIsNone(history.since(timezone.now()).archived)
+
+    def test_portfolio_totals_are_unchanged(self):
+        windows = [{}, {'start_date': (timezone.now() - timedelta(days=1050)).isoformat()},
+                   {'start_date': (timezone.now() - timedelta(days=1)).isoformat()}]
+        before = [self.client.get('/me/portfolio/', window).data for window in windows]
+        self.archive()
+        self.assertEqual([self.client.get('/me/portfolio/', window).data for window in windows], before)
+        self.assertEqual(before[0]['accounts'][0]['transaction_count'], 3)
+        self.assertEqual(before[1]['accounts'][0]['transaction_count'], 2)
+
+
+class ReportJobTestCase(BaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Reports are written under a throwaway MEDIA_ROOT, removed afterwards.
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        cls.addClassCleanup(media_override.disable)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reported', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Big', account_number='5050505050', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        for amount in (40, 60):
+            Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=amount)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin_user).access_token}')
+        self.url = f'/admin/user-transactions/{self.user.id}/reports/'
+
+    def work(self):
+        out = StringIO()
+        call_command('run_report_worker', '--once', '--processes', '0', stdout=out)
+        return out.getvalue()
+
+    def test_report_is_generated_and_downloaded(self):
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual((response.status_code, response.data['status']), (status.HTTP_202_ACCEPTED, 'pending'))
+        job_url = response['Location']
+        self.assertEqual(self.client.get(job_url)['Retry-After'], str(settings.REPORT_JOBS['POLL_INTERVAL']))
+        self.assertEqual(self.client.get(f'{job_url}download/').status_code, status.HTTP_409_CONFLICT)
+
+        self.assertIn(f"Report {response.data['id']}: done", self.work())
+        job = self.client.get(job_url).data
+        self.assertEqual(job['status'], 'done')
+
+        download = self.client.get(job['download'])
+        self.assertEqual(download['Content-Type'], 'application/gzip')
+        report = json.loads(gzip.decompress(b''.join(download.streaming_content)))
+        inline = json.loads(self.client.get(f'/admin/user-transactions/{self.user.id}/').content)
+        for key in ('total_balance', 'accounts', 'transactions'):
+            self.assertEqual(report[key], inline[key])
+
+    def test_identical_requests_share_a_job(self):
+        first = self.client.post(self.url, {}, format='json').data['id']
+        self.assertEqual(self.client.post(self.url, {}, format='json').data['id'], first)
+        start = {'start_date': (timezone.now() - timedelta(days=1)).isoformat()}
+        self.assertNotEqual(self.client.post(self.url, start, format='json').data['id'], first)
+
+        self.work()
+        self.assertEqual(self.client.post(self.url, {}, format='json').data['id'], first)
+        Transaction.objects.create(investment_account=self.account, transaction_type='deposit', amount=1)
+        self.assertNotEqual(self.client.post(self.url, {}, format='json').data['id'], first)
+
+    def test_failed_report_is_recorded_and_can_be_requested_again(self):
+        first = self.client.post(self.url, {}, format='json').data['id']
+        with mock.patch.object(reports, 'write_report', side_effect=RuntimeError('disk full')):
+            self.assertIn('failed', self.work())
+
+        job = ReportJob.objects.get(pk=first)
+        self.assertEqual((job.status, job.error), ('failed', 'RuntimeError: disk full'))
+        self.assertNotEqual(self.client.post(self.url, {}, format='json').data['id'], first)
+
+    def test_stale_running_job_is_claimed_again(self):
+        job, _ = reports.request_report(self.user)
+        self.assertEqual(reports.claim_jobs(5), [job.pk])
+        self.assertEqual(reports.claim_jobs(5), [])
+        later = timezone.now() + timedelta(seconds=settings.REPORT_JOBS['STALE_AFTER'] + 1)
+        self.assertEqual(reports.claim_jobs(5, now=later), [job.pk])
+
+    def test_expired_reports_are_purged(self):
+        self.client.post(self.url, {}, format='json')
+        self.work()
+        job = ReportJob.objects.get()
+        path = job.result.path
+        ReportJob.objects.update(finished_at=timezone.now() - timedelta(seconds=settings.REPORT_JOBS['RESULT_TTL'] + 1))
+
+        self.assertEqual(reports.purge_expired(), 1)
+        self.assertFalse(ReportJob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_crashed_pool_fails_its_jobs_and_is_replaced(self):
+        crashed, _ = reports.request_report(self.user)
+        later, _ = reports.request_report(self.user, start_date=timezone.now() - timedelta(days=1))
+
+        class CrashingExecutor(run_report_worker.InlineExecutor):
+            def submit(self, fn, *args):
+                future = Future()
+                future.set_exception(BrokenProcessPool('A child process terminated abruptly.'))
+                return future
+
+        executors = []
+
+        def make_executor():
+            executors.append(run_report_worker.InlineExecutor() if executors else CrashingExecutor())
+            return executors[-1]
+
+        out = StringIO()
+        run_report_worker.Command(stdout=out).work(make_executor, 1, 0, True)
+
+        self.assertEqual(len(executors), 2)
+        crashed.refresh_from_db()
+        self.assertEqual(crashed.status, 'failed')
+        self.assertIn('BrokenProcessPool', crashed.error)
+        self.assertEqual(ReportJob.objects.get(pk=later.pk).status, 'done')
+        self.assertIn(f'Report {later.pk}: done', out.getvalue())
+
+    def test_requires_admin_and_valid_dates(self):
+        self.assertEqual(self.client.post(self.url, {'end_date': 'soon'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/admin/user-transactions/999999/reports/', {}, format='json').status_code, 404)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(self.client.post(self.url, {}, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TransactionStatsTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='counted', password='password123')
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.account = InvestmentAccount.objects.create(account_name='Stats', account_number='6060606060', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=self.account, can_view=True)
+        for day, transaction_type, amount in (
+            (datetime(2024, 1, 10, 12), 'deposit', 100),
+            (datetime(2024, 1, 20, 12), 'withdrawal', 30),
+            (datetime(2024, 2, 5, 12), 'deposit', 25),
+        ):
+            item = Transaction.objects.create(
+                investment_account=self.account, transaction_type=transaction_type, amount=amount
+            )
+            Transaction.objects.filter(pk=item.pk).update(timestamp=timezone.make_aware(day))
+        self.url = f'/investment-accounts/{self.account.id}/transactions/stats/'
+        self.authenticate(self.user)
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def periods(self, response):
+        return [
+            (row['period'], row['deposit_count'], row['deposit_amount'], row['withdrawal_count'],
+             row['withdrawal_amount'], row['net'])
+            for row in response.data['results']
+        ]
+
+    def test_buckets_by_month_week_and_day(self):
+        self.assertEqual(self.periods(self.client.get(self.url)), [
+            ('2024-01-01', 1, '100.00', 1, '30.00', '70.00'),
+            ('2024-02-01', 1, '25.00', 0, '0.00', '25.00'),
+        ])
+        self.assertEqual(
+            [row[0] for row in self.periods(self.client.get(self.url, {'bucket': 'week'}))],
+            ['2024-01-08', '2024-01-15', '2024-02-05'],
+        )
+        self.assertEqual(len(self.client.get(self.url, {'bucket': 'day'}).data['results']), 3)
+        self.assertEqual(self.client.get(self.url, {'bucket': 'year'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_date_bounds(self):
+        response = self.client.get(self.url, {'start_date': '2024-01-15T00:00:00Z', 'end_date': '2024-01-31T00:00:00Z'})
+        self.assertEqual(self.periods(response), [('2024-01-01', 0, '0.00', 1, '30.00', '-30.00')])
+        self.assertEqual(self.client.get(self.url, {'end_date': 'soon'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_period_split_by_the_archive_is_merged(self):
+        before = self.client.get(self.url).data
+        archive_transactions(before=timezone.make_aware(datetime(2024, 1, 15)))
+        self.assertEqual(TransactionArchive.objects.count(), 1)
+        self.assertEqual(self.client.get(self.url).data, before)
+
+    def test_one_query_per_request(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_requires_view_permission(self):
+        self.authenticate(User.objects.create_user(username='stranger', password='password123'))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_admin_stats_cover_all_of_a_users_accounts(self):
+        other = InvestmentAccount.objects.create(account_name='Other', account_number='6161616161', balance=0)
+        UserInvestmentAccount.objects.create(user=self.user, investment_account=other, can_view=True)
+        Transaction.objects.create(investment_account=other, transaction_type='deposit', amount=10)
+
+        url = f'/admin/user-transactions/{self.user.id}/stats/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.authenticate(self.admin_user)
+        response = self.client.get(url, {'start_date': '2024-02-01T00:00:00Z'})
+        self.assertEqual(
+            [(row[1], row[2]) for row in self.periods(response)], [(1, '25.00'), (1, '10.00')]
+        )
+        self.assertEqual(self.client.get('/admin/user-transactions/999999/stats/').status_code, 404)
+
+
+class BulkGrantTestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.users = [User.objects.create_user(username=f'member{i}', password='password123') for i in range(3)]
+        self.accounts = [
+            InvestmentAccount.objects.create(account_name=f'Team {i}', account_number=f'707070707{i}', balance=0)
+            for i in range(2)
+        ]
+        self.authenticate(self.admin_user)
+        self.url = '/user-investment-accounts/bulk/'
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def grants(self):
+        return set(UserInvestmentAccount.objects.values_list(
+            'user_id', 'investment_account_id', 'can_view', 'can_create', 'can_update', 'can_delete'
+        ))
+
+    def test_creates_and_replaces_grants(self):
+        member, account = self.users[0], self.accounts[0]
+        UserInvestmentAccount.objects.create(user=member, investment_account=account, can_view=True, can_delete=True)
+        rows = [{'user': user.id, 'investment_account': account.id, 'can_view': True, 'can_update': True}
+                for user in self.users]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.data, {'created': 2, 'updated': 1, 'errors': []})
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('ON CONFLICT', writes[0])
+        self.assertEqual(self.grants(), {(user.id, account.id, True, False, True, False) for user in self.users})
+
+    def test_invalid_rows_are_reported(self):
+        rows = [
+            {'user': self.users[0].id, 'investment_account': self.accounts[0].id, 'can_view': True},
+            {'user': 999999, 'investment_account': self.accounts[0].id},
+            {'user': self.users[1].id},
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual((response.data['created'], [error['index'] for error in response.data['errors']]), (1, [1, 2]))
+        self.assertIn('user', response.data['errors'][0]['errors'])
+
+        UserInvestmentAccount.objects.all().delete()
+        response = self.client.post(f'{self.url}?atomic=true', rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(UserInvestmentAccount.objects.exists())
+
+    def test_later_row_for_a_pair_wins(self):
+        pair = {'user': self.users[0].id, 'investment_account': self.accounts[0].id}
+        response = self.client.post(self.url, [{**pair, 'can_view': True}, {**pair, 'can_create': True}], format='json')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(self.grants(), {(self.users[0].id, self.accounts[0].id, False, True, False, False)})
+
+    def test_grants_take_effect_for_cached_users(self):
+        member, account = self.users[0], self.accounts[0]
+        UserInvestmentAccount.objects.create(user=member, investment_account=account, can_view=True)
+        url = f'/investment-accounts/{account.id}/transactions/'
+        self.authenticate(member)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.authenticate(self.admin_user)
+        self.client.post(self.url, [{'user': member.id, 'investment_account': account.id}], format='json')
+        self.authenticate(member)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_requires_admin(self):
+        self.authenticate(self.users[0])
+        rows = [{'user': self.users[0].id, 'investment_account': self.accounts[0].id, 'can_view': True}]
+        self.assertEqual(self.client.post(self.url, rows, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        self.authenticate(self.admin_user)
+        self.assertEqual(self.client.post(self.url, {'user': 1}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
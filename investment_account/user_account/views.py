@@ -1,96 +1,223 @@
+import os
+from decimal import Decimal
+
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated, BasePermission
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .models import InvestmentAccount, UserInvestmentAccount, Transaction
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from .models import InvestmentAccount, UserInvestmentAccount, Transaction, ReportJob
 from .serializers import (
     InvestmentAccountSerializer,
     UserInvestmentAccountSerializer,
     TransactionSerializer,
-    UserSerializer, AdminInvestmentAccountSerializer, AdminTransactionSerializer, TransactionFilter
+    UserSerializer, AdminInvestmentAccountSerializer, AdminTransactionSerializer, TransactionFilter,
+    BulkTransactionSerializer, BalanceHistoryQuerySerializer, AdminAccountBalanceSerializer,
+    PortfolioAccountSerializer, ReportJobSerializer, BulkGrantSerializer, TransactionStatsQuerySerializer, TransactionBucketSerializer
 
 )
-from .permissions import IsAllowedToView, IsAllowedToCreate, IsAllowedToUpdateDelete, IsAdmin, DenyViewPermission
+from . import grant_cache
+from .archive import transaction_history
+from .conditional import account_updated_at, not_modified, set_validators, validators
+from .exports import EXPORT_FORMATS, transaction_rows
+from .fast_serializers import ValuesSerializer
+from .idempotency import idempotent
+from .middleware import request_stats, serialize_time
+from .pagination import KeysetPagination
+from .parsers import NDJSONParser, ORJSONParser
+from .posting import InsufficientFunds, delete_transaction, post_transaction, update_transaction
+from .reports import request_report
+from .stats import bucketed_totals
+from .permissions import (
+    IsAllowedToView, IsAllowedToCreate, IsAllowedToUpdateDelete, IsAdmin, get_account_grant
+)
 
 class InvestmentAccountViewSet(viewsets.ModelViewSet):
     queryset = InvestmentAccount.objects.all()
     serializer_class = InvestmentAccountSerializer
     permission_classes = [IsAuthenticated]  
+    account_url_kwarg = 'pk'
 
     def get_permissions(self):
         if self.action == 'retrieve':
             return [IsAuthenticated(), IsAllowedToView()]
         return super().get_permissions()
 
+    # Rows are fetched before serialize_time() so the query counts as DB time.
+    def list(self, request, *args, **kwargs):
+        accounts = list(self.filter_queryset(self.get_queryset()))
+        with serialize_time(request):
+            data = self.get_serializer(accounts, many=True).data
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = validators(request, account_updated_at(kwargs['pk']))
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            account = self.get_object()
+            with serialize_time(request):
+                data = self.get_serializer(account).data
+            response = Response(data)
+        return set_validators(response, etag, last_modified)
+
 class UserInvestmentAccountViewSet(viewsets.ModelViewSet):
-    queryset = UserInvestmentAccount.objects.all()
+    # UserInvestmentAccountSerializer renders both relations through __str__.
+    queryset = UserInvestmentAccount.objects.select_related('user', 'investment_account')
     serializer_class = UserInvestmentAccountSerializer
     permission_classes = [IsAuthenticated]  
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAdmin], parser_classes=[ORJSONParser, NDJSONParser])
+    def bulk(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a JSON array or an NDJSON body.'}, status=400)
+        if len(rows) > settings.GRANT_BULK_MAX_ROWS:
+            return Response({'error': f'At most {settings.GRANT_BULK_MAX_ROWS} rows can be posted at once.'}, status=400)
+
+        # ?atomic=true rejects the whole batch if any row is invalid.
+        all_or_nothing = request.query_params.get('atomic', '').lower() in ('1', 'true')
+        serializer = BulkGrantSerializer(many=True)
+        valid, errors = serializer.validate_rows(rows)
+
+        if (errors and all_or_nothing) or not valid:
+            return Response({'created': 0, 'updated': 0, 'errors': errors}, status=400)
+        created, updated = serializer.create(valid)
+        return Response({'created': created, 'updated': updated, 'errors': errors})
+
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]  
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         investment_account_pk = self.kwargs.get('investment_account_pk')
-        if not investment_account_pk:
-            return Transaction.objects.none()
-
-        user_inv_acc = UserInvestmentAccount.objects.filter(
-            user=self.request.user,
-            investment_account_id=investment_account_pk,
-            can_view=True
-        ).first()
+        grant = get_account_grant(self.request, investment_account_pk)
 
-        if user_inv_acc:
+        if grant and grant.can_view:
             return Transaction.objects.filter(investment_account_id=investment_account_pk)
         else:
             return Transaction.objects.none()
 
     def get_permissions(self):
-        investment_account_pk = self.kwargs.get('investment_account_pk')
-        if self.action == 'create':
+        if self.action in ['create', 'bulk']:
             return [IsAllowedToCreate()]
         elif self.action in ['update', 'partial_update', 'destroy']:
             return [IsAllowedToUpdateDelete()]
-        elif self.action in ['list', 'retrieve']:
+        elif self.action in ['list', 'retrieve', 'stats']:
             return [IsAllowedToView()]
         return super().get_permissions()
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         investment_account_id = self.kwargs.get('investment_account_pk')
-        user_inv_acc = UserInvestmentAccount.objects.filter(
-            user=self.request.user,
-            investment_account_id=investment_account_id,
-            can_create=True
-        ).first()
-
-        if not user_inv_acc:
-            raise serializers.ValidationError("You do not have permission to create transactions for this investment account.")
-        serializer.save(investment_account_id=investment_account_id)
-
-
-
-class IsAllowedToCreate(BasePermission):
-    def has_permission(self, request, view):
-        investment_account_id = view.kwargs.get('investment_account_pk')
-        return request.user.userinvestmentaccount_set.filter(
-            investment_account_id=investment_account_id,
-            can_create=True
-        ).exists()
-
-class IsAllowedToUpdateDelete(BasePermission):
-    def has_permission(self, request, view):
-        investment_account_id = view.kwargs.get('investment_account_pk')
-        return request.user.userinvestmentaccount_set.filter(
-            investment_account_id=investment_account_id,
-            can_update=True
-        ).exists() or request.user.userinvestmentaccount_set.filter(
-            investment_account_id=investment_account_id,
-            can_delete=True
-        ).exists()
+        grant = get_account_grant(self.request, investment_account_id)
+
+        if not (grant and grant.can_create):
+            raise PermissionDenied("You do not have permission to create transactions for this investment account.")
+        fields = dict(serializer.validated_data)
+        fields.pop('investment_account', None)
+        try:
+            serializer.instance = post_transaction(investment_account_id, **fields)
+        except InsufficientFunds as exc:
+            raise ValidationError({'amount': [str(exc)]})
+
+    def perform_update(self, serializer):
+        # Transactions stay on the account in the URL, as on create.
+        fields = dict(serializer.validated_data)
+        fields.pop('investment_account', None)
+        try:
+            serializer.instance = update_transaction(self.kwargs['investment_account_pk'], serializer.instance.pk, **fields)
+        except InsufficientFunds as exc:
+            raise ValidationError({'amount': [str(exc)]})
+
+    def perform_destroy(self, instance):
+        try:
+            delete_transaction(self.kwargs['investment_account_pk'], instance.pk)
+        except InsufficientFunds as exc:
+            raise ValidationError({'amount': [str(exc)]})
+
+    # Reads render .values() rows directly; the output matches TransactionSerializer.
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = validators(request, account_updated_at(kwargs['investment_account_pk']))
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            fast = ValuesSerializer(TransactionSerializer)
+            page = self.paginate_queryset(fast.values(self.get_history()))
+            with serialize_time(request):
+                data = fast.many(page)
+            response = self.get_paginated_response(data)
+        return set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        fast = ValuesSerializer(TransactionSerializer)
+        row = fast.values(self.get_history()).find(pk=kwargs['pk'])
+        if row is None:
+            raise Http404
+        with serialize_time(request):
+            data = fast.to_representation(row)
+        return Response(data)
+
+    def get_history(self):
+        # Reads also cover archived transactions. get_queryset() stays on the
+        # live table, so archived ones can't be updated or deleted.
+        return transaction_history(Q(investment_account_id=self.kwargs['investment_account_pk']))
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request, investment_account_pk=None):
+        return transaction_stats_response(request, Q(investment_account_id=investment_account_pk))
+
+    @action(detail=False, methods=['post'], parser_classes=[ORJSONParser, NDJSONParser])
+    @idempotent
+    def bulk(self, request, investment_account_pk=None):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a JSON array or an NDJSON body.'}, status=400)
+        if len(rows) > settings.TRANSACTION_BULK_MAX_ROWS:
+            return Response({'error': f'At most {settings.TRANSACTION_BULK_MAX_ROWS} rows can be posted at once.'}, status=400)
+
+        # ?atomic=true rejects the whole batch if any row is invalid.
+        all_or_nothing = request.query_params.get('atomic', '').lower() in ('1', 'true')
+        serializer = BulkTransactionSerializer(many=True, context={'investment_account_id': investment_account_pk})
+        valid, errors = serializer.validate_rows(rows)
+
+        if (errors and all_or_nothing) or not valid:
+            return Response({'created': 0, 'errors': errors}, status=400)
+        try:
+            created = serializer.create(valid)
+        except InsufficientFunds as exc:
+            return Response({'created': 0, 'errors': errors, 'error': str(exc)}, status=400)
+        return Response({'created': len(created), 'errors': errors}, status=201)
+
+
+def transaction_stats_response(request, transactions):
+    # Per-period deposit and withdrawal totals for the transactions matching
+    # the Q, within the request's TransactionFilter bounds.
+    params = TransactionStatsQuerySerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    transaction_filter = TransactionFilter(request.query_params, queryset=Transaction.objects.none())
+    if not transaction_filter.is_valid():
+        return Response(transaction_filter.errors, status=400)
+    bounds = transaction_filter.form.cleaned_data
+
+    bucket = params.validated_data['bucket']
+    rows = bucketed_totals(transaction_filter.history(transactions), bucket)
+    return Response({
+        'bucket': bucket,
+        'start_date': bounds.get('start_date'),
+        'end_date': bounds.get('end_date'),
+        'results': ValuesSerializer(TransactionBucketSerializer).many(rows),
+    })
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -108,20 +235,194 @@ class AdminUserTransactionsView(APIView):
         
         investment_accounts = InvestmentAccount.objects.filter(userinvestmentaccount__user=user)
         
-        transaction_filter = TransactionFilter(request.GET, queryset=Transaction.objects.filter(investment_account__in=investment_accounts))
-        filtered_transactions = transaction_filter.qs
+        transaction_filter = TransactionFilter(request.GET, queryset=Transaction.objects.none())
+        filtered_transactions = transaction_filter.history(Q(investment_account__in=investment_accounts))
         
+        # Per-account totals come back with the accounts in a single query.
+        investment_accounts = investment_accounts.with_total_balance().order_by('id')
+        total_balance = sum((account.total_balance for account in investment_accounts), Decimal('0'))
         
-        total_balance = sum(account.get_total_balance() for account in investment_accounts)
         
+        paginator = KeysetPagination()
+        transaction_serializer = ValuesSerializer(AdminTransactionSerializer)
+        transaction_page = paginator.paginate_queryset(
+            transaction_serializer.values(filtered_transactions), request, view=self
+        )
         
         account_serializer = AdminInvestmentAccountSerializer(investment_accounts, many=True)
-        transaction_serializer = AdminTransactionSerializer(filtered_transactions, many=True)
         
-        response_data = {
-            'total_balance': total_balance,
-            'accounts': account_serializer.data,
-            'transactions': transaction_serializer.data
-        }
+        with serialize_time(request):
+            response_data = {
+                'total_balance': total_balance,
+                'accounts': account_serializer.data,
+                'transactions': transaction_serializer.many(transaction_page),
+                'next': paginator.get_next_link()
+            }
         
         return Response(response_data)
+
+
+
+class AdminUserTransactionStatsView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request, user_id):
+        try:
+            user = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({'error': 'User not found'}, status=404)
+        investment_accounts = InvestmentAccount.objects.filter(userinvestmentaccount__user=user)
+        return transaction_stats_response(request, Q(investment_account__in=investment_accounts))
+
+
+class AdminUserTransactionsExportView(APIView):
+    permission_classes = [IsAdmin]
+    chunk_size = 2000
+
+    def perform_content_negotiation(self, request, force=False):
+        # The export picks its own content type from ?output=, so clients
+        # sending Accept: text/csv must not be turned away with a 406.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, user_id):
+        try:
+            user = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({'error': 'User not found'}, status=404)
+
+        output = request.GET.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'error': f"Unsupported output '{output}'. Use one of: {', '.join(EXPORT_FORMATS)}."}, status=400)
+
+        transaction_filter = TransactionFilter(request.GET, queryset=Transaction.objects.none())
+        if not transaction_filter.is_valid():
+            return Response(transaction_filter.errors, status=400)
+
+        content_type, render_lines = EXPORT_FORMATS[output]
+        history = transaction_filter.history(Q(investment_account__userinvestmentaccount__user=user))
+        rows = transaction_rows(history, chunk_size=self.chunk_size)
+        response = StreamingHttpResponse(render_lines(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="user-{user.id}-transactions.{output}"'
+        return response
+
+
+
+class AdminUserBalanceHistoryView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request, user_id):
+        try:
+            user = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({'error': 'User not found'}, status=404)
+
+        params = BalanceHistoryQuerySerializer(data=request.GET)
+        params.is_valid(raise_exception=True)
+        as_of = params.validated_data.get('as_of') or timezone.localdate()
+        start_date = params.validated_data.get('start_date')
+        end_date = params.validated_data.get('end_date') or as_of
+
+        investment_accounts = InvestmentAccount.objects.filter(
+            userinvestmentaccount__user=user
+        ).with_balance_history(as_of, start_date, end_date).order_by('id')
+        account_serializer = AdminAccountBalanceSerializer(investment_accounts, many=True)
+
+        return Response({
+            'as_of': as_of,
+            'start_date': start_date,
+            'end_date': end_date,
+            'total_balance_as_of': sum((account.balance_as_of for account in investment_accounts), Decimal('0')),
+            'net_flow': sum((account.net_flow for account in investment_accounts), Decimal('0')),
+            'accounts': account_serializer.data
+        })
+
+
+
+class AdminUserReportsView(APIView):
+    """
+    Queue a full user-transactions report for run_report_worker instead of
+    building it in the request.
+    """
+    permission_classes = [IsAdmin]
+
+    def post(self, request, user_id):
+        try:
+            user = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({'error': 'User not found'}, status=404)
+
+        transaction_filter = TransactionFilter(request.data, queryset=Transaction.objects.none())
+        if not transaction_filter.is_valid():
+            return Response(transaction_filter.errors, status=400)
+        bounds = transaction_filter.form.cleaned_data
+
+        job, _ = request_report(user, bounds.get('start_date'), bounds.get('end_date'), requested_by=request.user)
+        data = ReportJobSerializer(job, context={'request': request}).data
+        return Response(data, status=202, headers={'Location': reverse('admin-report', args=[job.pk])})
+
+
+class AdminReportView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk)
+        headers = {}
+        if job.status in (ReportJob.PENDING, ReportJob.RUNNING):
+            headers['Retry-After'] = str(settings.REPORT_JOBS['POLL_INTERVAL'])
+        return Response(ReportJobSerializer(job, context={'request': request}).data, headers=headers)
+
+
+class AdminReportDownloadView(APIView):
+    permission_classes = [IsAdmin]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The file is served as-is, whatever the client says it accepts.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk)
+        if job.status != ReportJob.DONE:
+            return Response({'error': f'The report is {job.status}.'}, status=409)
+        return FileResponse(
+            job.result.open('rb'), as_attachment=True, filename=os.path.basename(job.result.name),
+            content_type='application/gzip',
+        )
+
+
+
+class PortfolioView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        transaction_filter = TransactionFilter(request.GET, queryset=Transaction.objects.none())
+        if not transaction_filter.is_valid():
+            return Response(transaction_filter.errors, status=400)
+        bounds = transaction_filter.form.cleaned_data
+
+        # Grants, accounts and per-account transaction totals in one query.
+        account_serializer = ValuesSerializer(PortfolioAccountSerializer)
+        accounts = list(account_serializer.values(
+            InvestmentAccount.objects.viewable_by(request.user)
+            .with_activity(bounds.get('start_date'), bounds.get('end_date'))
+            .order_by('id')
+        ))
+
+        return Response({
+            'balance': sum((account['balance'] for account in accounts), Decimal('0')),
+            'accounts': account_serializer.many(accounts),
+        })
+
+
+
+class RequestStatsView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response({
+            'endpoints': request_stats.snapshot(),
+            'grant_cache': grant_cache.stats()
+        })
+
+    def delete(self, request):
+        request_stats.reset()
+        return Response(status=204)